@@ -1,9 +1,10 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_security import Security, SQLAlchemyUserDatastore, UserMixin, RoleMixin, login_required, roles_required
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask_socketio import SocketIO
 from datetime import datetime
+import click
 import os
 
 def create_app():
@@ -22,8 +23,22 @@ def create_app():
     
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
-    # Initialize SocketIO
-    socketio = SocketIO(app, cors_allowed_origins="*")
+    # Messages older than this are moved into compressed archive segments
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    
+    # Largest accepted upload (avatars, server icons, attachments)
+    app.config['MAX_UPLOAD_SIZE'] = int(os.environ.get('MAX_UPLOAD_MB', 25)) * 1024 * 1024
+    app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_UPLOAD_SIZE']
+    
+    # Load shedding thresholds for the single event loop
+    app.config['LOAD_SHEDDING_ENABLED'] = os.environ.get('LOAD_SHEDDING_ENABLED', '1') != '0'
+    app.config['LOAD_SHED_LAG_MS'] = int(os.environ.get('LOAD_SHED_LAG_MS', 100))
+    app.config['LOAD_SHED_MAX_IN_FLIGHT'] = int(os.environ.get('LOAD_SHED_MAX_IN_FLIGHT', 32))
+    app.config['LOAD_SHED_RETRY_AFTER'] = int(os.environ.get('LOAD_SHED_RETRY_AFTER', 2))
+    
+    # Initialize SocketIO. asgi.py selects threading mode, since its
+    # background tasks run beside an asyncio loop rather than a gevent hub.
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode=os.environ.get('SOCKETIO_ASYNC_MODE') or None)
     
     # Import db from models and initialize with app
     from models import db
@@ -32,11 +47,48 @@ def create_app():
     bcrypt = Bcrypt(app)
     
     # Import models after db initialization to avoid circular imports
-    from models import User, Server, Channel, Message, DirectMessage, Friend, ServerMember, Role, VoiceParticipant
+    from models import (User, Server, Channel, Message, DirectMessage, Friend, ServerMember, Role, VoiceParticipant,
+                        MediaBlob, Attachment)
+    
+    # Import message archive functionality
+    from archive import (archive_messages, channel_history, dm_history, search_channel, history_response,
+                         migrate_legacy_message_ids, HISTORY_PAGE_SIZE)
+    
+    # Import server export/import functionality
+    from server_export import export_server, import_server
     
     # Import voice channel functionality
     from voice_channels import register_voice_channel_events
     
+    # Import load shedding functionality
+    from load_shedding import load_monitor, shed_when_overloaded
+    load_monitor.init_app(app, socketio)
+    
+    # Import media storage functionality
+    from media_storage import (media_store, media_url, attach_files, is_digest, attachment_scope, media_visibility,
+                               backfill_attachment_scopes, record_upload, uploaded_by)
+    media_store.init_app(app)
+    app.jinja_env.globals['media_url'] = media_url
+    
+    # Import notification functionality
+    import notifications
+    from notifications import (notify_channel_message, notify_direct_message, unread_notifications,
+                               acknowledge_notifications, user_connected, user_disconnected, user_room)
+    notifications.init_app(app, socketio)
+    from snowflake import MAX_ID
+    
+    # Import Socket.IO wire format functionality
+    import wire_format
+    from wire_format import accepts_binary, emit_event
+    wire_format.init_app(socketio)
+    
+    # Import server metadata cache functionality
+    from server_cache import get_server_meta, get_channel_meta, invalidate_server, public_meta
+    
+    # Import member list functionality
+    from member_list import (register_member_list_events, member_index_for, member_joined, member_left,
+                             presence_changed, unsubscribe_member_list, MEMBER_WINDOW_SIZE, MAX_MEMBER_WINDOW_SIZE)
+    
     # Setup Flask-Security
     user_datastore = SQLAlchemyUserDatastore(db, User, Role)
     security = Security(app, user_datastore)
@@ -129,6 +181,38 @@ def create_app():
         
         db.create_all()
         
+        # /media checks attachment access against the message's channel or DM;
+        # fill the new column for attachments uploaded before that
+        if 'scope' not in [column['name'] for column in inspect(db.engine).get_columns('attachments')]:
+            from sqlalchemy import text
+            db.session.execute(text('ALTER TABLE attachments ADD COLUMN scope VARCHAR(64)'))
+            db.session.commit()
+            backfill_attachment_scopes()
+        
+        # create_all() skips tables that already exist, so add the history,
+        # member and media lookup indexes to older databases separately
+        for table in (Message.__table__, DirectMessage.__table__, ServerMember.__table__,
+                      User.__table__, Server.__table__, Attachment.__table__):
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+        
+        # Migrate autoincrement message ids to snowflake ids. SQLite's integer
+        # primary keys are already 64-bit; other databases need BIGINT first.
+        from sqlalchemy import text
+        if 'sqlite' not in str(db.engine.url).lower():
+            for table_name in ('messages', 'direct_messages'):
+                id_column = next(c for c in inspect(db.engine).get_columns(table_name) if c['name'] == 'id')
+                if 'BIGINT' not in str(id_column['type']).upper():
+                    db.session.execute(text(f'ALTER TABLE {table_name} ALTER COLUMN id TYPE BIGINT'))
+                    db.session.commit()
+        try:
+            migrated = migrate_legacy_message_ids()
+            if migrated:
+                print(f"Migrated {migrated} message ids to snowflake ids.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Migration warning: {e}")
+        
         # Import models after db initialization to avoid circular imports
         from models import User, Server, Channel, Message, DirectMessage, Friend, ServerMember, Role, VoiceParticipant
         
@@ -259,10 +343,35 @@ def create_app():
             flash('You are not a member of this server', 'error')
             return redirect(url_for('dashboard'))
         
-        server = Server.query.get_or_404(server_id)
-        channels = Channel.query.filter_by(server_id=server_id).order_by(Channel.position).all()
+        # Server row and channel list come from the metadata cache
+        server = get_server_meta(server_id)
+        if server is None:
+            abort(404)
+        
+        return render_template('server.html', server=server, channels=server['channels'])
+    
+    @app.route('/api/server/<int:server_id>')
+    def server_metadata(server_id):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not logged in'}), 401
+        
+        member = ServerMember.query.filter_by(user_id=session['user_id'], server_id=server_id).first()
+        if not member:
+            return jsonify({'error': 'You are not a member of this server'}), 403
+        
+        server = get_server_meta(server_id)
+        if server is None:
+            return jsonify({'error': 'Server not found'}), 404
         
-        return render_template('server.html', server=server, channels=channels)
+        # Clients that already hold this version skip the channel list
+        etag = f"server-{server_id}-{server['version']}"
+        if request.args.get('version') == str(server['version']) or etag in request.if_none_match:
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(dict(public_meta(server), version=str(server['version'])))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     
     @app.route('/server/<int:server_id>/join')
     def join_server(server_id):
@@ -280,29 +389,121 @@ def create_app():
         db.session.add(member)
         db.session.commit()
         
+        user = User.query.get(session['user_id'])
+        member_joined(server_id, user.id, user.username, member.role, user.status)
+        
         server = Server.query.get_or_404(server_id)
         flash(f'You have joined "{server.name}"', 'success')
         return redirect(url_for('server', server_id=server_id))
     
+    @app.route('/server/<int:server_id>/leave')
+    def leave_server(server_id):
+        if 'user_id' not in session:
+            return redirect(url_for('login'))
+        
+        member = ServerMember.query.filter_by(user_id=session['user_id'], server_id=server_id).first()
+        if not member:
+            flash('You are not a member of this server', 'error')
+            return redirect(url_for('dashboard'))
+        
+        # The owner can't leave their own server
+        if member.role == 'owner':
+            flash('The server owner cannot leave the server', 'error')
+            return redirect(url_for('server', server_id=server_id))
+        
+        db.session.delete(member)
+        db.session.commit()
+        
+        member_left(server_id, session['user_id'])
+        
+        flash('You have left the server', 'success')
+        return redirect(url_for('dashboard'))
+    
+    @app.route('/api/server/<int:server_id>/members')
+    def server_members(server_id):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not logged in'}), 401
+        
+        # Served from the in-memory member index
+        index = member_index_for(server_id, session['user_id'])
+        if index is None:
+            return jsonify({'error': 'You are not a member of this server'}), 403
+        
+        start = max(0, request.args.get('start', 0, type=int))
+        count = max(1, min(request.args.get('count', MEMBER_WINDOW_SIZE, type=int), MAX_MEMBER_WINDOW_SIZE))
+        
+        return jsonify(index.window(start, count))
+    
     # Channel routes
     @app.route('/channel/<int:channel_id>')
+    @shed_when_overloaded
     def channel(channel_id):
         if 'user_id' not in session:
             return redirect(url_for('login'))
         
-        channel = Channel.query.get_or_404(channel_id)
-        server = channel.server
+        server, channel = get_channel_meta(channel_id)
+        if channel is None:
+            abort(404)
         
         # Check if user is a member of the server
-        member = ServerMember.query.filter_by(user_id=session['user_id'], server_id=server.id).first()
+        member = ServerMember.query.filter_by(user_id=session['user_id'], server_id=server['id']).first()
         if not member:
             flash('You are not a member of this server', 'error')
             return redirect(url_for('dashboard'))
         
-        messages = Message.query.filter_by(channel_id=channel_id).order_by(Message.created_at).all()
+        # Only the most recent page is rendered; older history is fetched
+        # through the history API as the client scrolls. Reading through to
+        # the archive keeps fully archived channels reachable.
+        messages = attach_files(channel_history(channel_id), 'channel')
         
         return render_template('channel.html', channel=channel, server=server, messages=messages)
     
+    @app.route('/api/channel/<int:channel_id>/messages')
+    @shed_when_overloaded
+    def channel_messages(channel_id):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not logged in'}), 401
+        
+        server, channel = get_channel_meta(channel_id)
+        if channel is None:
+            abort(404)
+        member = ServerMember.query.filter_by(user_id=session['user_id'], server_id=server['id']).first()
+        if not member:
+            return jsonify({'error': 'You are not a member of this server'}), 403
+        
+        before = request.args.get('before', type=int)
+        if before is not None and not 0 <= before <= MAX_ID:
+            return jsonify({'error': 'before must be a message id'}), 400
+        limit = max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 100))
+        messages = attach_files(channel_history(channel_id, before=before, limit=limit), 'channel')
+        
+        return jsonify(history_response(messages, messages[0]['id'] if len(messages) == limit else None))
+    
+    @app.route('/api/channel/<int:channel_id>/search')
+    @shed_when_overloaded
+    def channel_search(channel_id):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not logged in'}), 401
+        
+        server, channel = get_channel_meta(channel_id)
+        if channel is None:
+            abort(404)
+        member = ServerMember.query.filter_by(user_id=session['user_id'], server_id=server['id']).first()
+        if not member:
+            return jsonify({'error': 'You are not a member of this server'}), 403
+        
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'messages': [], 'next_before': None})
+        
+        before = request.args.get('before', type=int)
+        if before is not None and not 0 <= before <= MAX_ID:
+            return jsonify({'error': 'before must be a message id'}), 400
+        limit = max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 100))
+        messages = attach_files(search_channel(channel_id, query, before=before, limit=limit), 'channel')
+        
+        return jsonify(history_response(messages, messages[-1]['id'] if len(messages) == limit else None))
+    
     @app.route('/channel/create/<int:server_id>', methods=['POST'])
     def create_channel(server_id):
         if 'user_id' not in session:
@@ -330,6 +531,7 @@ def create_app():
         channel = Channel(name=name, server_id=server_id, type=channel_type)
         db.session.add(channel)
         db.session.commit()
+        invalidate_server(server_id)
         
         flash(f'Channel "#{name}" created successfully!', 'success')
         return redirect(url_for('server', server_id=server_id))
@@ -340,16 +542,19 @@ def create_app():
         if 'user_id' not in session:
             return redirect(url_for('login'))
         
-        content = request.form['content']
-        if not content.strip():
+        content = request.form.get('content', '')
+        has_attachment = _has_upload('attachment')
+        if not content.strip() and not has_attachment:
             flash('Message cannot be empty', 'error')
             return redirect(url_for('channel', channel_id=channel_id))
         
         # Check if channel exists
-        channel = Channel.query.get_or_404(channel_id)
+        server, channel = get_channel_meta(channel_id)
+        if channel is None:
+            abort(404)
         
         # Check if user is a member of the server
-        member = ServerMember.query.filter_by(user_id=session['user_id'], server_id=channel.server_id).first()
+        member = ServerMember.query.filter_by(user_id=session['user_id'], server_id=server['id']).first()
         if not member:
             flash('You are not a member of this server', 'error')
             return redirect(url_for('dashboard'))
@@ -357,12 +562,19 @@ def create_app():
         # Create new message
         message = Message(content=content.strip(), author_id=session['user_id'], channel_id=channel_id)
         db.session.add(message)
+        if has_attachment and not _attach_upload('channel', message):
+            db.session.rollback()
+            return redirect(url_for('channel', channel_id=channel_id))
         db.session.commit()
         
+        # Mentions are fanned out in the background
+        notify_channel_message(message, server['id'])
+        
         return redirect(url_for('channel', channel_id=channel_id))
     
     # Direct messaging routes
     @app.route('/dm/<int:user_id>')
+    @shed_when_overloaded
     def direct_message(user_id):
         if 'user_id' not in session:
             return redirect(url_for('login'))
@@ -370,11 +582,9 @@ def create_app():
         # Check if user exists
         recipient = User.query.get_or_404(user_id)
         
-        # Get messages between current user and recipient
-        messages = DirectMessage.query.filter(
-            ((DirectMessage.sender_id == session['user_id']) & (DirectMessage.recipient_id == user_id)) |
-            ((DirectMessage.sender_id == user_id) & (DirectMessage.recipient_id == session['user_id']))
-        ).order_by(DirectMessage.created_at).all()
+        # Get the most recent page of messages between current user and
+        # recipient, including archived ones
+        messages = attach_files(dm_history(session['user_id'], user_id), 'dm')
         
         # Mark messages as read
         DirectMessage.query.filter(
@@ -386,13 +596,30 @@ def create_app():
         
         return render_template('direct_message.html', recipient=recipient, messages=messages)
     
+    @app.route('/api/dm/<int:user_id>/messages')
+    @shed_when_overloaded
+    def direct_message_history(user_id):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not logged in'}), 401
+        
+        User.query.get_or_404(user_id)
+        
+        before = request.args.get('before', type=int)
+        if before is not None and not 0 <= before <= MAX_ID:
+            return jsonify({'error': 'before must be a message id'}), 400
+        limit = max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 100))
+        messages = attach_files(dm_history(session['user_id'], user_id, before=before, limit=limit), 'dm')
+        
+        return jsonify(history_response(messages, messages[0]['id'] if len(messages) == limit else None))
+    
     @app.route('/dm/send/<int:user_id>', methods=['POST'])
     def send_direct_message(user_id):
         if 'user_id' not in session:
             return redirect(url_for('login'))
         
-        content = request.form['content']
-        if not content.strip():
+        content = request.form.get('content', '')
+        has_attachment = _has_upload('attachment')
+        if not content.strip() and not has_attachment:
             flash('Message cannot be empty', 'error')
             return redirect(url_for('direct_message', user_id=user_id))
         
@@ -402,8 +629,13 @@ def create_app():
         # Create new direct message
         message = DirectMessage(content=content.strip(), sender_id=session['user_id'], recipient_id=user_id)
         db.session.add(message)
+        if has_attachment and not _attach_upload('dm', message):
+            db.session.rollback()
+            return redirect(url_for('direct_message', user_id=user_id))
         db.session.commit()
         
+        notify_direct_message(message)
+        
         return redirect(url_for('direct_message', user_id=user_id))
     
     # Friend routes
@@ -529,6 +761,147 @@ def create_app():
         
         return redirect(url_for('friends'))
     
+    # Media routes
+    def _has_upload(field):
+        upload = request.files.get(field)
+        return bool(upload and upload.filename) or is_digest(request.form.get(f'{field}_digest'))
+    
+    def _save_upload(field, images_only=False):
+        """Store the uploaded file in `field`, flashing and returning None on failure."""
+        upload = request.files.get(field)
+        if not upload or not upload.filename:
+            flash('No file selected', 'error')
+            return None
+        try:
+            blob = media_store.save(upload.stream, upload.filename, upload.mimetype)
+        except ValueError as e:
+            flash(str(e), 'error')
+            return None
+        if images_only and not media_store.is_image(blob):
+            flash('Please choose a PNG, JPEG, GIF, WebP or BMP image', 'error')
+            return None
+        return blob
+    
+    def _attach_upload(kind, message):
+        # A file in the form, or the digest of one uploaded through /api/media
+        digest = request.form.get('attachment_digest')
+        if is_digest(digest):
+            # Only files this user uploaded, so a digest seen in someone
+            # else's link can't be re-attached to get around media access
+            blob = db.session.get(MediaBlob, digest)
+            if blob is None or not uploaded_by(digest, session['user_id']):
+                flash('Attachment not found', 'error')
+                return False
+            filename = request.form.get('attachment_name') or digest
+        else:
+            blob = _save_upload('attachment')
+            if blob is None:
+                return False
+            filename = request.files['attachment'].filename
+        
+        db.session.flush()
+        db.session.add(Attachment(digest=blob.digest, filename=filename[:255], uploader_id=session['user_id'],
+                                  message_kind=kind, message_id=message.id,
+                                  scope=attachment_scope(kind, message)))
+        return True
+    
+    @app.route('/media/<digest>')
+    def media(digest):
+        # Avatars and server icons are public; attachments only go to
+        # people who can see the message they belong to
+        visibility = media_visibility(digest, session.get('user_id'))
+        if visibility is None:
+            abort(404)
+        response = media_store.send(digest, size=request.args.get('size', type=int), public=visibility == 'public')
+        if response is None:
+            abort(404)
+        return response
+    
+    @app.route('/api/media', methods=['POST'])
+    def upload_media():
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not logged in'}), 401
+        
+        # Raw request bodies are hashed and written as they arrive
+        filename = request.headers.get('X-Filename', '')
+        try:
+            blob = media_store.save(request.stream, filename, request.mimetype)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        record_upload(blob.digest, session['user_id'])
+        db.session.commit()
+        
+        return jsonify({'digest': blob.digest, 'size': blob.size, 'content_type': blob.content_type,
+                        'url': media_url(blob.digest)})
+    
+    @app.route('/profile/avatar', methods=['POST'])
+    def upload_avatar():
+        if 'user_id' not in session:
+            return redirect(url_for('login'))
+        
+        blob = _save_upload('avatar', images_only=True)
+        if blob:
+            user = User.query.get(session['user_id'])
+            user.avatar = blob.digest
+            db.session.commit()
+            flash('Avatar updated', 'success')
+        
+        return redirect(url_for('dashboard'))
+    
+    @app.route('/server/<int:server_id>/icon', methods=['POST'])
+    def upload_server_icon(server_id):
+        if 'user_id' not in session:
+            return redirect(url_for('login'))
+        
+        member = ServerMember.query.filter_by(user_id=session['user_id'], server_id=server_id).first()
+        if not member or member.role not in ['owner', 'admin']:
+            flash('You do not have permission to change the server icon', 'error')
+            return redirect(url_for('dashboard'))
+        
+        blob = _save_upload('icon', images_only=True)
+        if blob:
+            server = Server.query.get_or_404(server_id)
+            server.icon = blob.digest
+            db.session.commit()
+            invalidate_server(server_id)
+            flash('Server icon updated', 'success')
+        
+        return redirect(url_for('server', server_id=server_id))
+    
+    # Notification routes
+    @app.route('/api/notifications')
+    def notifications_list():
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not logged in'}), 401
+        
+        after = request.args.get('after', type=int)
+        if after is not None and not 0 <= after <= MAX_ID:
+            return jsonify({'error': 'after must be a notification id'}), 400
+        limit = max(1, min(request.args.get('limit', 50, type=int), 100))
+        items, unread = unread_notifications(session['user_id'], after=after, limit=limit)
+        
+        return jsonify({'notifications': items, 'unread': unread,
+                        'next_after': items[-1]['id'] if len(items) == limit else None})
+    
+    @app.route('/api/notifications/ack', methods=['POST'])
+    def notifications_ack():
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not logged in'}), 401
+        
+        data = request.get_json(silent=True) or request.form
+        try:
+            up_to = int(data.get('up_to', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'up_to must be a notification id'}), 400
+        if not 0 <= up_to <= MAX_ID:
+            return jsonify({'error': 'up_to must be a notification id'}), 400
+        
+        return jsonify({'last_read_id': str(acknowledge_notifications(session['user_id'], up_to))})
+    
+    @app.route('/metrics')
+    def metrics():
+        return jsonify(load_monitor.metrics())
+    
     # User status routes
     @app.route('/status/update', methods=['POST'])
     def update_status():
@@ -550,6 +923,8 @@ def create_app():
             user.last_seen = datetime.utcnow()
             db.session.commit()
             
+            presence_changed(user.id, status)
+            
             # Return JSON response for AJAX requests
             if request.headers.get('Content-Type') == 'application/json':
                 return jsonify({'success': True, 'status': status})
@@ -557,62 +932,84 @@ def create_app():
         # Redirect back for regular form submissions
         return redirect(request.referrer or url_for('dashboard'))
     
-    # WebRTC Signaling Event Handlers
+    @socketio.on('connect')
+    def handle_connect(auth=None):
+        wire_format.negotiate(request.sid, auth)
+        # Each user's sockets share a room so notifications reach every tab
+        user_id = session.get('user_id')
+        if user_id:
+            wire_format.join(user_room(user_id))
+            user_connected(user_id, request.sid)
+    
+    @socketio.on('disconnect')
+    def handle_disconnect():
+        unsubscribe_member_list(request.sid)
+        user_disconnected(request.sid)
+        wire_format.forget(request.sid)
+    
+    # WebRTC Signaling Event Handlers (offers, answers and call events are
+    # relayed by the voice channel module)
     @socketio.on('join_voice_room')
+    @accepts_binary
     def handle_join_voice_room(data):
         room = data['room']
         user_id = data['user_id']
-        join_room(room)
-        emit('user_joined', {'user_id': user_id}, room=room)
+        wire_format.join(room)
+        emit_event('user_joined', {'user_id': user_id}, to=room)
     
     @socketio.on('leave_voice_room')
+    @accepts_binary
     def handle_leave_voice_room(data):
         room = data['room']
         user_id = data['user_id']
-        leave_room(room)
-        emit('user_left', {'user_id': user_id}, room=room)
-    
-    @socketio.on('offer')
-    def handle_offer(data):
-        offer = data['offer']
-        target_user = data['target_user']
-        emit('offer', {'offer': offer, 'user_id': session['user_id']}, room=target_user)
-    
-    @socketio.on('answer')
-    def handle_answer(data):
-        answer = data['answer']
-        target_user = data['target_user']
-        emit('answer', {'answer': answer, 'user_id': session['user_id']}, room=target_user)
-    
-    @socketio.on('ice_candidate')
-    def handle_ice_candidate(data):
-        candidate = data['candidate']
-        target_user = data['target_user']
-        emit('ice_candidate', {'candidate': candidate, 'user_id': session['user_id']}, room=target_user)
-    
-    @socketio.on('voice_call')
-    def handle_voice_call(data):
-        target_user = data['target_user']
-        emit('incoming_call', {'user_id': session['user_id'], 'username': data['username']}, room=target_user)
-    
-    @socketio.on('call_accepted')
-    def handle_call_accepted(data):
-        target_user = data['target_user']
-        emit('call_accepted', {'user_id': session['user_id']}, room=target_user)
-    
-    @socketio.on('call_rejected')
-    def handle_call_rejected(data):
-        target_user = data['target_user']
-        emit('call_rejected', {'user_id': session['user_id']}, room=target_user)
-    
-    @socketio.on('end_call')
-    def handle_end_call(data):
-        target_user = data['target_user']
-        emit('call_ended', {'user_id': session['user_id']}, room=target_user)
+        wire_format.leave(room)
+        emit_event('user_left', {'user_id': user_id}, to=room)
     
     # Register voice channel events
     register_voice_channel_events(socketio)
     
+    # Register member list events
+    register_member_list_events(socketio)
+    
+    # CLI commands
+    @app.cli.command('archive-messages')
+    @click.option('--older-than-days', type=int, default=None,
+                  help='Archive messages older than this many days (defaults to ARCHIVE_AFTER_DAYS).')
+    def archive_messages_command(older_than_days):
+        """Move old channel and direct messages into compressed archive segments."""
+        if older_than_days is None:
+            older_than_days = app.config['ARCHIVE_AFTER_DAYS']
+        channel_count, dm_count = archive_messages(older_than_days)
+        print(f"Archived {channel_count} channel messages and {dm_count} direct messages older than {older_than_days} days.")
+    
+    @app.cli.command('export-server')
+    @click.argument('server_id', type=int)
+    @click.option('-o', '--output', type=click.File('w', encoding='utf-8'), default='-',
+                  help='File to write the NDJSON export to (defaults to stdout).')
+    def export_server_command(server_id, output):
+        """Stream a server's channels, members and messages as NDJSON."""
+        for line in export_server(server_id):
+            output.write(line)
+            output.write('\n')
+    
+    @app.cli.command('import-server')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--checkpoint', type=click.Path(dir_okay=False), default=None,
+                  help='Checkpoint file used to resume an interrupted import (defaults to PATH.checkpoint).')
+    @click.option('--owner', default=None, help='Username to own the imported server instead of the original owner.')
+    def import_server_command(path, checkpoint, owner):
+        """Import a server from an NDJSON export, resuming from a checkpoint if present."""
+        owner_id = None
+        if owner:
+            owner_user = User.query.filter_by(username=owner).first()
+            if not owner_user:
+                raise click.ClickException(f'User "{owner}" not found')
+            owner_id = owner_user.id
+        
+        with open(path, encoding='utf-8') as f:
+            server_id, imported = import_server(f, checkpoint_path=checkpoint or path + '.checkpoint', owner_id=owner_id)
+        print(f"Imported {imported} records into server {server_id}.")
+    
     return app, socketio
 
 # Create application instance for gunicorn
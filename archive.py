@@ -0,0 +1,306 @@
+import json
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam
+from models import db, User, Message, DirectMessage, ArchivedMessageSegment
+from snowflake import LEGACY_ID_LIMIT, legacy_id_to_snowflake
+
+# Number of messages returned per history page
+HISTORY_PAGE_SIZE = 50
+
+# Rows moved from the hot tables per archival transaction
+ARCHIVE_BATCH_SIZE = 5000
+
+# Decoded segments kept in memory so scrolling through a month doesn't
+# decompress the same payload for every page
+SEGMENT_CACHE_SIZE = 32
+
+_segment_cache = OrderedDict()
+
+
+def dm_scope(user_a, user_b):
+    low, high = sorted((int(user_a), int(user_b)))
+    return f'{low}:{high}'
+
+
+def _encode_segment(rows):
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def decode_segment(segment):
+    # Segments are rewritten when a later archival run merges into them,
+    # so the message count is part of the cache key
+    key = (segment.id, segment.message_count, segment.max_id)
+    rows = _segment_cache.get(key)
+    if rows is None:
+        rows = json.loads(zlib.decompress(segment.payload).decode('utf-8'))
+        _segment_cache[key] = rows
+        if len(_segment_cache) > SEGMENT_CACHE_SIZE:
+            _segment_cache.popitem(last=False)
+    else:
+        _segment_cache.move_to_end(key)
+    return rows
+
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+
+def parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def serialize_message(message):
+    return {
+        'id': message.id,
+        'content': message.content,
+        'author_id': message.author_id,
+        'channel_id': message.channel_id,
+        'created_at': isoformat(message.created_at),
+        'edited_at': isoformat(message.edited_at),
+    }
+
+
+def serialize_direct_message(message):
+    return {
+        'id': message.id,
+        'content': message.content,
+        'sender_id': message.sender_id,
+        'recipient_id': message.recipient_id,
+        'created_at': isoformat(message.created_at),
+        'is_read': bool(message.is_read),
+    }
+
+
+def history_response(messages, next_before):
+    """JSON body for a history page.
+
+    Snowflake ids are beyond JavaScript's safe integer range, so ids and the
+    cursor are sent as strings.
+    """
+    for message in messages:
+        message['id'] = str(message['id'])
+    return {'messages': messages, 'next_before': str(next_before) if next_before is not None else None}
+
+
+def _attach_usernames(rows, id_field, name_field):
+    user_ids = {row[id_field] for row in rows}
+    if not user_ids:
+        return rows
+    names = dict(db.session.query(User.id, User.username).filter(User.id.in_(user_ids)).all())
+    for row in rows:
+        row[name_field] = names.get(row[id_field], 'Unknown')
+    return rows
+
+
+# ====================
+# ARCHIVAL JOB
+# ====================
+
+def _merge_into_segment(kind, scope, month, rows):
+    with db.session.no_autoflush:
+        segment = ArchivedMessageSegment.query.filter_by(kind=kind, scope=scope, month=month).first()
+    if segment:
+        merged = decode_segment(segment) + rows
+        merged.sort(key=lambda row: row['id'])
+    else:
+        merged = sorted(rows, key=lambda row: row['id'])
+        segment = ArchivedMessageSegment(kind=kind, scope=scope, month=month)
+        db.session.add(segment)
+
+    segment.payload = _encode_segment(merged)
+    segment.min_id = merged[0]['id']
+    segment.max_id = merged[-1]['id']
+    segment.message_count = len(merged)
+    segment.archived_at = datetime.utcnow()
+
+
+def _flush_segments(model, kind, pending):
+    expired_ids = []
+    for (scope, month), rows in pending.items():
+        _merge_into_segment(kind, scope, month, rows)
+        expired_ids.extend(row['id'] for row in rows)
+
+    # The hot rows are removed in the same transaction that writes their segment
+    for offset in range(0, len(expired_ids), ARCHIVE_BATCH_SIZE):
+        chunk = expired_ids[offset:offset + ARCHIVE_BATCH_SIZE]
+        db.session.query(model).filter(model.id.in_(chunk)).delete(synchronize_session=False)
+    db.session.commit()
+    return len(expired_ids)
+
+
+def _archive_table(model, kind, scope_of, serialize, cutoff, batch_size):
+    archived = 0
+    last_id = 0
+    pending = {}
+    pending_count = 0
+
+    while True:
+        # Ids grow with time, so the oldest rows sit at the front of the
+        # primary key and no created_at index is needed to find them.
+        # Plain rows are enough here and skip building ORM objects.
+        batch = db.session.query(*model.__table__.columns).filter(
+            model.id > last_id).order_by(model.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        reached_cutoff = False
+        for message in batch:
+            last_id = message.id
+            if message.created_at is None:
+                continue
+            if message.created_at >= cutoff:
+                reached_cutoff = True
+                continue
+            key = (scope_of(message), message.created_at.strftime('%Y-%m'))
+            pending.setdefault(key, []).append(serialize(message))
+            pending_count += 1
+        current_month = batch[-1].created_at.strftime('%Y-%m') if batch[-1].created_at else None
+
+        # Rows arrive in time order, so months before the current one are
+        # complete and each segment is compressed once instead of per batch
+        if pending_count >= batch_size * 20:
+            ready = pending
+            pending = {}
+        else:
+            ready = {key: rows for key, rows in pending.items() if current_month and key[1] < current_month}
+            for key in ready:
+                del pending[key]
+        if ready:
+            archived += _flush_segments(model, kind, ready)
+            pending_count = sum(len(rows) for rows in pending.values())
+
+        if reached_cutoff:
+            break
+
+    if pending:
+        archived += _flush_segments(model, kind, pending)
+
+    return archived
+
+
+def archive_messages(older_than_days, batch_size=ARCHIVE_BATCH_SIZE):
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    channel_count = _archive_table(
+        Message, 'channel', lambda m: str(m.channel_id),
+        serialize_message, cutoff, batch_size)
+    dm_count = _archive_table(
+        DirectMessage, 'dm', lambda m: dm_scope(m.sender_id, m.recipient_id),
+        serialize_direct_message, cutoff, batch_size)
+
+    return channel_count, dm_count
+
+
+# ====================
+# SNOWFLAKE ID MIGRATION
+# ====================
+
+def migrate_legacy_message_ids(batch_size=ARCHIVE_BATCH_SIZE):
+    """Rewrite autoincrement message ids, hot and archived, as snowflake ids.
+
+    Each batch commits on its own and migrated rows are no longer below
+    LEGACY_ID_LIMIT, so an interrupted run picks up where it stopped.
+    Returns the number of ids rewritten.
+    """
+    migrated = 0
+
+    for model in (Message, DirectMessage):
+        table = model.__table__
+        update = table.update().where(table.c.id == bindparam('old_id')).values(id=bindparam('new_id'))
+        while True:
+            rows = db.session.query(table.c.id, table.c.created_at).filter(
+                table.c.id < LEGACY_ID_LIMIT).order_by(table.c.id).limit(batch_size).all()
+            if not rows:
+                break
+            db.session.execute(update, [
+                {'old_id': row.id, 'new_id': legacy_id_to_snowflake(row.id, row.created_at)} for row in rows])
+            db.session.commit()
+            migrated += len(rows)
+
+    segment_ids = [row[0] for row in db.session.query(ArchivedMessageSegment.id).filter(
+        ArchivedMessageSegment.min_id < LEGACY_ID_LIMIT).all()]
+    for segment_id in segment_ids:
+        segment = db.session.get(ArchivedMessageSegment, segment_id)
+        rows = [dict(row) for row in decode_segment(segment)]
+        for row in rows:
+            if row['id'] < LEGACY_ID_LIMIT:
+                row['id'] = legacy_id_to_snowflake(row['id'], parse_datetime(row['created_at']))
+                migrated += 1
+        rows.sort(key=lambda row: row['id'])
+
+        segment.payload = _encode_segment(rows)
+        segment.min_id = rows[0]['id']
+        segment.max_id = rows[-1]['id']
+        db.session.commit()
+
+    return migrated
+
+
+# ====================
+# READ-THROUGH HISTORY
+# ====================
+
+def _archived_rows(kind, scope, before, matches=None):
+    # Walk segments newest first, yielding rows newest first
+    query = db.session.query(ArchivedMessageSegment.id).filter_by(kind=kind, scope=scope)
+    if before is not None:
+        query = query.filter(ArchivedMessageSegment.min_id < before)
+    segment_ids = [row[0] for row in query.order_by(ArchivedMessageSegment.max_id.desc()).all()]
+
+    for segment_id in segment_ids:
+        segment = db.session.get(ArchivedMessageSegment, segment_id)
+        for row in reversed(decode_segment(segment)):
+            if before is not None and row['id'] >= before:
+                continue
+            if matches is None or matches(row):
+                yield dict(row)
+
+
+def _read_through(hot_query, model, serialize, kind, scope, before, limit, matches=None):
+    if before is not None:
+        hot_query = hot_query.filter(model.id < before)
+    page = [serialize(m) for m in hot_query.order_by(model.id.desc()).limit(limit).all()]
+
+    # Only touch the archive once the hot window is exhausted
+    if len(page) < limit:
+        cursor = page[-1]['id'] if page else before
+        for row in _archived_rows(kind, scope, cursor, matches):
+            page.append(row)
+            if len(page) >= limit:
+                break
+
+    return page
+
+
+def channel_history(channel_id, before=None, limit=HISTORY_PAGE_SIZE):
+    page = _read_through(
+        Message.query.filter_by(channel_id=channel_id), Message, serialize_message,
+        'channel', str(channel_id), before, limit)
+    page.reverse()
+    return _attach_usernames(page, 'author_id', 'author')
+
+
+def dm_history(user_id, other_id, before=None, limit=HISTORY_PAGE_SIZE):
+    hot_query = DirectMessage.query.filter(
+        ((DirectMessage.sender_id == user_id) & (DirectMessage.recipient_id == other_id)) |
+        ((DirectMessage.sender_id == other_id) & (DirectMessage.recipient_id == user_id))
+    )
+    page = _read_through(
+        hot_query, DirectMessage, serialize_direct_message,
+        'dm', dm_scope(user_id, other_id), before, limit)
+    page.reverse()
+    return _attach_usernames(page, 'sender_id', 'sender')
+
+
+def search_channel(channel_id, text, before=None, limit=HISTORY_PAGE_SIZE):
+    needle = text.lower()
+    hot_query = Message.query.filter(
+        (Message.channel_id == channel_id) &
+        db.func.lower(Message.content).contains(needle, autoescape=True))
+    results = _read_through(
+        hot_query, Message, serialize_message, 'channel', str(channel_id), before, limit,
+        matches=lambda row: needle in row['content'].lower())
+    # Search results stay newest first
+    return _attach_usernames(results, 'author_id', 'author')
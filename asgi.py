@@ -0,0 +1,217 @@
+"""Native asyncio (ASGI) deployment mode.
+
+Runs the same Socket.IO events as app.py and voice_channels.py on an asyncio
+Socket.IO server with async database access, while regular HTTP routes are
+served by the Flask app through a WSGI adapter. Signaling relays come from
+the table in voice_channels.py, member list windows and notifications from
+their modules, and events are encoded through wire_format, so both servers
+speak the same protocol. Unlike the gevent worker this needs no
+monkey-patching and runs on current Python versions:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import os
+from http.cookies import SimpleCookie
+
+import socketio
+from asgiref.wsgi import WsgiToAsgi
+from flask.sessions import SecureCookieSessionInterface
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+# The Flask app's own background tasks (notification fan-out, load
+# sampling) run in threads here; there is no gevent hub to run greenlets
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'threading')
+
+import wire_format
+from app import app as flask_app
+from load_shedding import load_monitor
+from member_list import subscribe_member_list, unsubscribe_member_list
+from models import db, VoiceParticipant
+from notifications import user_connected, user_disconnected, user_room
+from voice_channels import SIGNALING_RELAYS, relay_payload
+
+
+def _async_database_url(url):
+    # Same database as the Flask app, through an asyncio driver
+    if url.drivername in ('sqlite', 'sqlite+pysqlite'):
+        return url.set(drivername='sqlite+aiosqlite')
+    if url.drivername in ('postgresql', 'postgresql+psycopg2'):
+        return url.set(drivername='postgresql+asyncpg')
+    return url
+
+
+with flask_app.app_context():
+    engine = create_async_engine(_async_database_url(db.engine.url))
+
+AsyncSession = async_sessionmaker(engine, expire_on_commit=False)
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+
+
+async def _startup():
+    # Events emitted from Flask routes and background threads (presence
+    # changes, notifications) go out through this server
+    wire_format.init_async_server(sio, asyncio.get_running_loop())
+    # Shedding and /metrics follow this loop's lag, not the threads'
+    load_monitor.start_asyncio(asyncio.get_running_loop())
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=WsgiToAsgi(flask_app), on_startup=_startup)
+
+_session_serializer = SecureCookieSessionInterface().get_signing_serializer(flask_app)
+
+
+def _load_flask_session(environ):
+    # Read the user id from the same signed session cookie Flask uses
+    cookie = SimpleCookie(environ.get('HTTP_COOKIE', ''))
+    morsel = cookie.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if morsel is None or _session_serializer is None:
+        return {}
+    try:
+        return _session_serializer.loads(
+            morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return {}
+
+
+async def _user_id(sid):
+    session = await sio.get_session(sid)
+    return session.get('user_id')
+
+
+async def _emit(event, payload, to):
+    for data, target in wire_format.deliveries(payload, to):
+        await sio.emit(event, data, to=target)
+
+
+async def _enter_room(sid, room):
+    await sio.enter_room(sid, wire_format.room_to_enter(sid, room))
+
+
+async def _leave_room(sid, room):
+    await sio.leave_room(sid, wire_format.room_to_leave(sid, room))
+
+
+def _in_app_context(function, *args):
+    with flask_app.app_context():
+        return function(*args)
+
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    user_id = _load_flask_session(environ).get('user_id')
+    await sio.save_session(sid, {'user_id': user_id})
+    handshake = wire_format.choose_format(sid, auth)
+    if handshake is not None:
+        await sio.emit('wire_format', handshake, to=sid)
+    # Each user's sockets share a room so notifications reach every tab
+    if user_id:
+        await _enter_room(sid, user_room(user_id))
+        user_connected(user_id, sid)
+
+
+@sio.event
+async def disconnect(sid, *args):
+    unsubscribe_member_list(sid)
+    user_disconnected(sid)
+    wire_format.forget(sid)
+
+
+# WebRTC Signaling Event Handlers (see app.py)
+@sio.on('join_voice_room')
+async def handle_join_voice_room(sid, data):
+    data = wire_format.decode(data)
+    room = data['room']
+    await _enter_room(sid, room)
+    await _emit('user_joined', {'user_id': data['user_id']}, room)
+
+
+@sio.on('leave_voice_room')
+async def handle_leave_voice_room(sid, data):
+    data = wire_format.decode(data)
+    room = data['room']
+    await _leave_room(sid, room)
+    await _emit('user_left', {'user_id': data['user_id']}, room)
+
+
+def _register_relay(event, target_event, fields):
+    async def handle_relay(sid, data):
+        data = wire_format.decode(data)
+        user_id = await _user_id(sid)
+        if not user_id:
+            return
+        await _emit(target_event, relay_payload(fields, user_id, data), data['target_user'])
+
+    sio.on(event, handle_relay)
+
+
+for _event, (_target_event, _fields) in SIGNALING_RELAYS.items():
+    _register_relay(_event, _target_event, _fields)
+
+
+# Voice Channel Event Handlers (see voice_channels.py)
+@sio.on('join_voice_channel')
+async def handle_join_voice_channel(sid, data):
+    data = wire_format.decode(data)
+    channel_id = data['channel_id']
+    user_id = await _user_id(sid)
+
+    if not user_id:
+        return
+
+    await _enter_room(sid, f'channel_{channel_id}')
+
+    async with AsyncSession() as session:
+        existing_participant = await session.scalar(
+            select(VoiceParticipant.id).filter_by(user_id=user_id, channel_id=channel_id))
+        if existing_participant is None:
+            session.add(VoiceParticipant(user_id=user_id, channel_id=channel_id))
+            await session.commit()
+
+    await _emit('user_joined_voice_channel', {
+        'user_id': user_id,
+        'username': data.get('username', 'Unknown')
+    }, f'channel_{channel_id}')
+
+
+@sio.on('leave_voice_channel')
+async def handle_leave_voice_channel(sid, data):
+    data = wire_format.decode(data)
+    channel_id = data['channel_id']
+    user_id = await _user_id(sid)
+
+    if not user_id:
+        return
+
+    await _leave_room(sid, f'channel_{channel_id}')
+
+    async with AsyncSession() as session:
+        participant = await session.scalar(
+            select(VoiceParticipant).filter_by(user_id=user_id, channel_id=channel_id))
+        if participant is not None:
+            await session.delete(participant)
+            await session.commit()
+
+    await _emit('user_left_voice_channel', {
+        'user_id': user_id
+    }, f'channel_{channel_id}')
+
+
+# Member List Event Handlers (see member_list.py)
+@sio.on('subscribe_member_list')
+async def handle_subscribe_member_list(sid, data):
+    data = wire_format.decode(data)
+    user_id = await _user_id(sid)
+    # The first subscriber builds the server's index with one synchronous
+    # query; run it in a thread so the loop keeps serving other sockets
+    window = await asyncio.to_thread(_in_app_context, subscribe_member_list, sid, user_id, data)
+    if window is not None:
+        await _emit('member_list_sync', window, sid)
+
+
+@sio.on('unsubscribe_member_list')
+async def handle_unsubscribe_member_list(sid, data):
+    data = wire_format.decode(data)
+    unsubscribe_member_list(sid, int(data['server_id']))
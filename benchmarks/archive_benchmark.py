@@ -0,0 +1,124 @@
+"""Insert and recent-page latency at scale, with and without message archival.
+
+Seeds a scratch SQLite database with --rows channel messages spread over the
+last two years, measures single-message insert and recent-page latency, runs
+the archival job and measures again.
+
+Usage: python benchmarks/archive_benchmark.py [--rows 10000000] [--hot-days 30]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+    return f"p50={pick(0.50):.3f}ms p99={pick(0.99):.3f}ms mean={statistics.mean(samples) * 1000:.3f}ms"
+
+
+def seed(db, Message, user_id, channel_ids, rows, span_days):
+    now = datetime.utcnow()
+    start = now - timedelta(days=span_days)
+    step = timedelta(days=span_days) / rows
+    table = Message.__table__
+    batch_size = 50000
+    began = time.perf_counter()
+
+    for offset in range(0, rows, batch_size):
+        batch = [{
+            'content': f'benchmark message {i}',
+            'author_id': user_id,
+            'channel_id': channel_ids[i % len(channel_ids)],
+            'created_at': start + step * i,
+        } for i in range(offset, min(rows, offset + batch_size))]
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        if offset and offset % 1000000 == 0:
+            print(f"  seeded {offset:,} rows ({time.perf_counter() - began:.0f}s)")
+
+    print(f"Seeded {rows:,} messages in {time.perf_counter() - began:.1f}s")
+
+
+def measure(db, Message, channel_history, user_id, channel_ids, samples, label):
+    insert_times = []
+    for _ in range(samples):
+        began = time.perf_counter()
+        db.session.add(Message(content='fresh message', author_id=user_id, channel_id=random.choice(channel_ids)))
+        db.session.commit()
+        insert_times.append(time.perf_counter() - began)
+
+    page_times = []
+    for _ in range(samples):
+        channel_id = random.choice(channel_ids)
+        began = time.perf_counter()
+        channel_history(channel_id)
+        page_times.append(time.perf_counter() - began)
+
+    print(f"[{label}] insert      {percentiles(insert_times)}")
+    print(f"[{label}] recent page {percentiles(page_times)}")
+
+
+def measure_scrollback(db, Message, channel_history, channel_ids, samples, label):
+    # Pages from deep history, which hit the archive once it exists
+    oldest_id = db.session.query(db.func.max(Message.id)).scalar() // 4
+    page_times = []
+    for _ in range(samples):
+        began = time.perf_counter()
+        channel_history(random.choice(channel_ids), before=oldest_id)
+        page_times.append(time.perf_counter() - began)
+    print(f"[{label}] deep page   {percentiles(page_times)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--channels', type=int, default=100)
+    parser.add_argument('--span-days', type=int, default=730)
+    parser.add_argument('--hot-days', type=int, default=30)
+    parser.add_argument('--samples', type=int, default=500)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='voxify-archive-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    from app import app
+    from models import db, User, Server, Channel, Message
+    from archive import archive_messages, channel_history
+
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', password='x')
+        db.session.add(user)
+        db.session.commit()
+        server = Server(name='bench', owner_id=user.id)
+        db.session.add(server)
+        db.session.commit()
+        channels = [Channel(name=f'channel-{i}', server_id=server.id) for i in range(args.channels)]
+        db.session.add_all(channels)
+        db.session.commit()
+        channel_ids = [channel.id for channel in channels]
+        user_id = user.id
+
+        seed(db, Message, user_id, channel_ids, args.rows, args.span_days)
+        measure(db, Message, channel_history, user_id, channel_ids, args.samples, 'no archival')
+        measure_scrollback(db, Message, channel_history, channel_ids, args.samples, 'no archival')
+
+        began = time.perf_counter()
+        channel_count, _ = archive_messages(args.hot_days)
+        db.session.execute(db.text('VACUUM'))
+        print(f"Archived {channel_count:,} messages in {time.perf_counter() - began:.1f}s, "
+              f"{Message.query.count():,} left in the hot table")
+
+        measure(db, Message, channel_history, user_id, channel_ids, args.samples, 'archived')
+        measure_scrollback(db, Message, channel_history, channel_ids, args.samples, 'archived')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Export and import throughput for a single server's history.
+
+Seeds a scratch SQLite database with one server holding --rows messages,
+exports it to NDJSON and imports the file into a second scratch database,
+reporting messages per second for each direction. Exits with a failure
+when import falls short of --min-import-rate.
+
+Usage: python benchmarks/export_import_benchmark.py [--rows 1000000] [--min-import-rate 100000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def seed(db, User, Server, ServerMember, Channel, Message, rows, members, channel_count):
+    users = [User(username=f'user{i}', email=f'user{i}@example.com', password='x') for i in range(members)]
+    db.session.add_all(users)
+    db.session.commit()
+    server = Server(name='bench', owner_id=users[0].id)
+    db.session.add(server)
+    db.session.commit()
+    db.session.add_all([ServerMember(user_id=user.id, server_id=server.id) for user in users])
+    channels = [Channel(name=f'channel-{i}', server_id=server.id, position=i) for i in range(channel_count)]
+    db.session.add_all(channels)
+    db.session.commit()
+
+    start = datetime.utcnow() - timedelta(days=365)
+    user_ids = [user.id for user in users]
+    channel_ids = [channel.id for channel in channels]
+    for offset in range(0, rows, 50000):
+        db.session.execute(Message.__table__.insert(), [{
+            'content': f'benchmark message number {i} with a little bit of text',
+            'author_id': user_ids[i % len(user_ids)],
+            'channel_id': channel_ids[i % len(channel_ids)],
+            'created_at': start + timedelta(seconds=i),
+        } for i in range(offset, min(rows, offset + 50000))])
+        db.session.commit()
+    return server.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--members', type=int, default=1000)
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--min-import-rate', type=float, default=100000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='voxify-export-bench-')
+    export_path = os.path.join(workdir, 'server.ndjson')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'source.db')
+
+    from app import app, create_app
+    from models import db, User, Server, ServerMember, Channel, Message
+    from server_export import export_server, import_server
+
+    with app.app_context():
+        server_id = seed(db, User, Server, ServerMember, Channel, Message, args.rows, args.members, args.channels)
+        print(f"Seeded {args.rows:,} messages")
+
+        began = time.perf_counter()
+        with open(export_path, 'w', encoding='utf-8') as f:
+            for line in export_server(server_id):
+                f.write(line)
+                f.write('\n')
+        elapsed = time.perf_counter() - began
+        size = os.path.getsize(export_path)
+        print(f"Export: {elapsed:.2f}s, {args.rows / elapsed:,.0f} messages/sec, {size / 1e6:.1f} MB")
+
+    # Import into a fresh database
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'target.db')
+    target_app, _ = create_app()
+
+    with target_app.app_context():
+        began = time.perf_counter()
+        with open(export_path, encoding='utf-8') as f:
+            _, imported = import_server(f)
+        elapsed = time.perf_counter() - began
+        count = Message.query.count()
+        rate = count / elapsed
+        print(f"Import: {elapsed:.2f}s, {rate:,.0f} messages/sec ({imported:,} records)")
+
+    if rate < args.min_import_rate:
+        print(f"FAIL: import {rate:,.0f} messages/sec is below {args.min_import_rate:,.0f}")
+        sys.exit(1)
+    print(f"OK: import {rate:,.0f} messages/sec is at least {args.min_import_rate:,.0f}")
+
+
+if __name__ == '__main__':
+    main()
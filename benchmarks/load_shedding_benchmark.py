@@ -0,0 +1,144 @@
+"""Signaling latency while the event loop is flooded with blocking requests.
+
+Starts the app on a gevent server, adds a low-priority route that burns CPU
+for --block-ms per request (standing in for a bcrypt hash or a huge page
+render), and hammers it from --blockers concurrent clients. Meanwhile one
+Socket.IO client keeps sending `offer` to itself and records the round trip.
+The run is repeated with load shedding disabled and enabled.
+
+Exits non-zero if the signaling p99 with shedding enabled is above
+--max-p99-ms.
+
+Usage: python benchmarks/load_shedding_benchmark.py [--blockers 20] [--block-ms 50]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000 if samples else 0.0
+
+
+def run_child(args):
+    from gevent import monkey
+    monkey.patch_all()
+
+    import time
+    import gevent
+    import gevent.event
+    import requests
+    import socketio as socketio_client
+
+    sys.path.insert(0, ROOT)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['LOAD_SHEDDING_ENABLED'] = '1' if args.child == 'on' else '0'
+
+    from app import app, socketio
+    from load_shedding import shed_when_overloaded
+
+    @app.route('/api/bench/block')
+    @shed_when_overloaded
+    def bench_block():
+        deadline = time.perf_counter() + args.block_ms / 1000.0
+        while time.perf_counter() < deadline:
+            pass
+        return 'ok'
+
+    base_url = f'http://127.0.0.1:{args.port}'
+    gevent.spawn(socketio.run, app, host='127.0.0.1', port=args.port, log_output=False)
+    gevent.sleep(1)
+    requests.get(base_url + '/metrics')
+
+    cookie = app.session_interface.get_signing_serializer(app).dumps({'user_id': 1})
+    client = socketio_client.Client(reconnection=False)
+    reply = gevent.event.Event()
+    client.on('offer', lambda data: reply.set())
+    client.connect(base_url, headers={'Cookie': f'session={cookie}'})
+
+    def offer_round_trip():
+        reply.clear()
+        began = time.perf_counter()
+        client.emit('offer', {'offer': 'sdp', 'target_user': client.get_sid()})
+        if reply.wait(timeout=10):
+            return time.perf_counter() - began
+
+    # Warm up the connection before the load starts
+    offer_round_trip()
+
+    stop = gevent.event.Event()
+    outcomes = {'served': 0, 'shed': 0}
+
+    def blocker():
+        session = requests.Session()
+        while not stop.is_set():
+            response = session.get(base_url + '/api/bench/block')
+            if response.status_code == 503:
+                outcomes['shed'] += 1
+                stop.wait(float(response.headers.get('Retry-After', 1)) / 10)
+            else:
+                outcomes['served'] += 1
+
+    blockers = [gevent.spawn(blocker) for _ in range(args.blockers)]
+
+    latencies = []
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        latency = offer_round_trip()
+        if latency is not None:
+            latencies.append(latency)
+        gevent.sleep(0.02)
+
+    stop.set()
+    gevent.joinall(blockers, timeout=5)
+    metrics = requests.get(base_url + '/metrics').json()
+    client.disconnect()
+
+    print(json.dumps({'latencies': latencies, 'outcomes': outcomes, 'metrics': metrics}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--blockers', type=int, default=20)
+    parser.add_argument('--block-ms', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--max-p99-ms', type=float, default=500)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--child', choices=['on', 'off'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args)
+
+    results = {}
+    for mode in ('off', 'on'):
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', mode, '--blockers', str(args.blockers),
+             '--block-ms', str(args.block_ms), '--duration', str(args.duration), '--port', str(args.port)],
+            capture_output=True, text=True, check=True, cwd=ROOT).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results[mode] = result
+
+        latencies = result['latencies']
+        lag = result['metrics']['loop_lag_ms']
+        print(f"[shedding {mode:>3}] signaling p50={percentile(latencies, 0.5):.1f}ms "
+              f"p99={percentile(latencies, 0.99):.1f}ms max={percentile(latencies, 1.0):.1f}ms "
+              f"({len(latencies)} offers)")
+        print(f"[shedding {mode:>3}] blocking requests served={result['outcomes']['served']} "
+              f"shed={result['outcomes']['shed']}; loop lag p50={lag['p50']}ms p99={lag['p99']}ms")
+
+    p99 = percentile(results['on']['latencies'], 0.99)
+    if p99 > args.max_p99_ms:
+        print(f"FAIL: signaling p99 {p99:.1f}ms with shedding enabled exceeds {args.max_p99_ms}ms")
+        sys.exit(1)
+    print(f"OK: signaling p99 {p99:.1f}ms with shedding enabled is within {args.max_p99_ms}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Sender latency and fan-out throughput for @everyone mentions.
+
+For each server size in --members, seeds a scratch SQLite database with
+that many members, posts --messages @everyone messages through the send
+route and reports the sender's request latency and how long the background
+worker takes to write every notification row. Sender latency should stay
+flat as the audience grows.
+
+Usage: python benchmarks/notification_benchmark.py [--members 100,10000,100000]
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+    return f"p50={pick(0.50):.2f}ms p99={pick(0.99):.2f}ms mean={statistics.mean(samples) * 1000:.2f}ms"
+
+
+def seed(db, User, Server, ServerMember, Channel, members):
+    users = User.__table__
+    batch_size = 50000
+    for offset in range(0, members, batch_size):
+        db.session.execute(users.insert(), [{
+            'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'x',
+            'fs_uniquifier': f'bench-{i}', 'status': 'offline',
+        } for i in range(offset, min(members, offset + batch_size))])
+    db.session.commit()
+
+    owner_id = db.session.query(db.func.min(User.id)).scalar()
+    server = Server(name='Benchmark', owner_id=owner_id)
+    db.session.add(server)
+    db.session.flush()
+    db.session.execute(ServerMember.__table__.insert().from_select(
+        ['user_id', 'server_id', 'role'],
+        db.select(User.id, db.literal(server.id), db.literal('member'))))
+    channel = Channel(name='general', server_id=server.id, type='text')
+    db.session.add(channel)
+    db.session.commit()
+    return owner_id, channel.id
+
+
+def run(members, messages):
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    from app import create_app
+    from models import db, User, Server, ServerMember, Channel, Notification
+    import notifications
+
+    app, socketio = create_app()
+    with app.app_context():
+        owner_id, channel_id = seed(db, User, Server, ServerMember, Channel, members)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = owner_id
+
+    plain, mentions = [], []
+    fan_out_began = None
+    for i in range(messages):
+        for content, samples in ((f'plain message {i}', plain), (f'@everyone announcement {i}', mentions)):
+            began = time.perf_counter()
+            client.post(f'/message/send/{channel_id}', data={'content': content})
+            samples.append(time.perf_counter() - began)
+            if fan_out_began is None and samples is mentions:
+                fan_out_began = began
+
+    notifications.wait_until_idle()
+    fan_out = time.perf_counter() - fan_out_began
+
+    with app.app_context():
+        rows = db.session.query(db.func.count(Notification.id)).scalar()
+
+    print(f"[{members:>7} members] send plain    {percentiles(plain)}")
+    print(f"[{members:>7} members] send @everyone {percentiles(mentions)}")
+    print(f"[{members:>7} members] fan-out wrote {rows:,} notifications in {fan_out:.2f}s "
+          f"({rows / fan_out:,.0f} rows/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', default='100,10000,100000')
+    parser.add_argument('--messages', type=int, default=20)
+    args = parser.parse_args()
+
+    for members in (int(value) for value in args.members.split(',')):
+        run(members, args.messages)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Concurrent websocket connections and event latency against a running server.
+
+Opens --connections Socket.IO clients and measures event round trips while
+all clients fire at once. Two events can be timed:
+
+- join_voice_room -> user_joined: pure signaling, no database work.
+- join_voice_channel -> user_joined_voice_channel: a participant lookup
+  and insert per event (and a lookup and delete on the leave that follows),
+  the blocking SQLAlchemy work that stalls a gevent hub. Each client is
+  logged in as its own bench user with its own voice channel; they are
+  created in the server's database on first use, so run the benchmark with
+  the server's DATABASE_URL and SECRET_KEY.
+
+Run it against both deployment modes, e.g.:
+
+    gunicorn --worker-class geventwebsocket.gunicorn.workers.GeventWebSocketWorker -w 1 -b :5000 app:app
+    uvicorn asgi:app --port 5001
+
+    python benchmarks/realtime_benchmark.py --url http://localhost:5000 --event join_voice_channel
+    python benchmarks/realtime_benchmark.py --url http://localhost:5001 --event join_voice_channel
+
+Requires python-socketio[asyncio_client].
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REPLIES = {
+    'join_voice_room': 'user_joined',
+    'join_voice_channel': 'user_joined_voice_channel',
+}
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+
+
+def bench_sessions(count):
+    """(cookie header, voice channel id) for `count` logged-in bench users."""
+    from flask.sessions import SecureCookieSessionInterface
+    from app import app
+    from models import db, User, Server, ServerMember, Channel
+
+    with app.app_context():
+        users = {user.username: user for user in User.query.filter(User.username.like('bench_user_%')).all()}
+        new_users = [User(username=f'bench_user_{i}', email=f'bench_user_{i}@bench.invalid', password='x')
+                     for i in range(count) if f'bench_user_{i}' not in users]
+        db.session.add_all(new_users)
+        db.session.commit()
+        users.update((user.username, user) for user in new_users)
+        user_ids = [users[f'bench_user_{i}'].id for i in range(count)]
+
+        server = Server.query.filter_by(name='bench_server').first()
+        if server is None:
+            server = Server(name='bench_server', owner_id=user_ids[0])
+            db.session.add(server)
+            db.session.commit()
+        channels = {channel.name: channel.id for channel in Channel.query.filter_by(server_id=server.id).all()}
+        new_channels = [Channel(name=f'bench_voice_{i}', server_id=server.id, type='voice')
+                        for i in range(count) if f'bench_voice_{i}' not in channels]
+        db.session.add_all(new_channels)
+        db.session.commit()
+        channels.update((channel.name, channel.id) for channel in new_channels)
+
+        members = {row[0] for row in db.session.query(ServerMember.user_id).filter_by(server_id=server.id).all()}
+        db.session.add_all([ServerMember(user_id=user_id, server_id=server.id, role='member')
+                            for user_id in user_ids if user_id not in members])
+        db.session.commit()
+
+        serializer = SecureCookieSessionInterface().get_signing_serializer(app)
+        cookie_name = app.config['SESSION_COOKIE_NAME']
+        return [(f"{cookie_name}={serializer.dumps({'user_id': user_id})}", channels[f'bench_voice_{i}'])
+                for i, user_id in enumerate(user_ids)]
+
+
+async def connect_client(url, event, index, session):
+    client = socketio.AsyncClient(reconnection=False)
+    replies = asyncio.Queue()
+    client.on(REPLIES[event], lambda data: replies.put_nowait(time.perf_counter()))
+    headers = {'Cookie': session[0]} if session else {}
+    await client.connect(url, transports=['websocket'], headers=headers)
+    return client, replies, session[1] if session else None
+
+
+async def round_trip(client, replies, event, index, channel_id):
+    began = time.perf_counter()
+    if event == 'join_voice_channel':
+        await client.emit('join_voice_channel', {'channel_id': channel_id, 'username': f'bench_user_{index}'})
+    else:
+        await client.emit('join_voice_room', {'room': f'bench-room-{index}', 'user_id': index})
+    received = await asyncio.wait_for(replies.get(), timeout=30)
+    if event == 'join_voice_channel':
+        # Leaving deletes the participant row, so the next join inserts again
+        await client.emit('leave_voice_channel', {'channel_id': channel_id})
+    return received - began
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--event', choices=sorted(REPLIES), default='join_voice_room')
+    args = parser.parse_args()
+
+    sessions = bench_sessions(args.connections) if args.event == 'join_voice_channel' else None
+
+    began = time.perf_counter()
+    clients = []
+    # Connect in waves so the accept backlog isn't the thing being measured
+    for offset in range(0, args.connections, 50):
+        clients.extend(await asyncio.gather(*(
+            connect_client(args.url, args.event, i, sessions[i] if sessions else None)
+            for i in range(offset, min(args.connections, offset + 50)))))
+    connect_time = time.perf_counter() - began
+    print(f"Connected {len(clients)} clients in {connect_time:.2f}s "
+          f"({len(clients) / connect_time:,.0f} connections/sec)")
+
+    latencies = []
+    began = time.perf_counter()
+    for _ in range(args.rounds):
+        latencies.extend(await asyncio.gather(*(
+            round_trip(client, replies, args.event, i, channel_id)
+            for i, (client, replies, channel_id) in enumerate(clients))))
+    elapsed = time.perf_counter() - began
+
+    print(f"{args.event}: {len(latencies)} events in {elapsed:.2f}s ({len(latencies) / elapsed:,.0f} events/sec)")
+    print(f"Latency p50={percentile(latencies, 0.50):.2f}ms p95={percentile(latencies, 0.95):.2f}ms "
+          f"p99={percentile(latencies, 0.99):.2f}ms mean={statistics.mean(latencies) * 1000:.2f}ms")
+
+    await asyncio.gather(*(client.disconnect() for client, _, _ in clients))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""Snowflake id generator throughput, monotonicity and cross-worker uniqueness.
+
+Generates --ids ids on one generator and reports ids/second, then runs
+--workers generators concurrently in threads (one worker id each) and checks
+that every id is unique and each worker's ids are strictly increasing.
+
+Usage: python benchmarks/snowflake_benchmark.py [--ids 1000000] [--workers 4]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from snowflake import SnowflakeGenerator, MAX_SEQUENCE
+
+
+def single_worker(count):
+    next_id = SnowflakeGenerator(worker_id=1).next_id
+    began = time.perf_counter()
+    ids = [next_id() for _ in range(count)]
+    elapsed = time.perf_counter() - began
+
+    assert all(a < b for a, b in zip(ids, ids[1:])), 'ids are not strictly increasing'
+    print(f"single worker: {count} ids in {elapsed:.2f}s ({count / elapsed:,.0f} ids/s, "
+          f"limit {(MAX_SEQUENCE + 1) * 1000:,} ids/s per worker)")
+
+
+def concurrent_workers(count, workers):
+    results = [None] * workers
+
+    def run(worker_id):
+        next_id = SnowflakeGenerator(worker_id=worker_id).next_id
+        results[worker_id] = [next_id() for _ in range(count)]
+
+    threads = [threading.Thread(target=run, args=(worker_id,)) for worker_id in range(workers)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    for ids in results:
+        assert all(a < b for a, b in zip(ids, ids[1:])), 'ids are not strictly increasing'
+    total = count * workers
+    unique = len({i for ids in results for i in ids})
+    assert unique == total, f'{total - unique} duplicate ids across workers'
+    print(f"{workers} workers: {total} ids in {elapsed:.2f}s ({total / elapsed:,.0f} ids/s), all unique")
+
+
+def shared_generator(count, threads):
+    # Several threads drawing from one process-wide generator, as the
+    # column default does
+    generator = SnowflakeGenerator(worker_id=2)
+    results = [None] * threads
+
+    def run(index):
+        results[index] = [generator.next_id() for _ in range(count)]
+
+    workers = [threading.Thread(target=run, args=(index,)) for index in range(threads)]
+    began = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - began
+
+    total = count * threads
+    unique = len({i for ids in results for i in ids})
+    assert unique == total, f'{total - unique} duplicate ids from a shared generator'
+    print(f"{threads} threads sharing one generator: {total} ids in {elapsed:.2f}s "
+          f"({total / elapsed:,.0f} ids/s), all unique")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ids', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    single_worker(args.ids)
+    concurrent_workers(args.ids // args.workers, args.workers)
+    shared_generator(args.ids // args.workers, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Socket.IO wire size and encode/decode time, JSON vs MessagePack.
+
+Builds the Socket.IO packets the server would send for typical signaling,
+presence, member list and notification events, once as JSON and once in the
+negotiated MessagePack format (aliased keys, binary attachment, JSON below
+BINARY_MIN_SIZE), and reports bytes on the wire per event plus the time to
+encode and decode each packet. Bytes include the attachment placeholder the
+binary format adds; WebSocket frame headers (2-4 bytes per frame, and the
+binary format needs one more frame) are not counted.
+
+Usage: python benchmarks/wire_format_benchmark.py [--rounds 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socketio import packet
+
+import wire_format
+
+
+def _sdp(kind):
+    lines = ['v=0', 'o=- 4611731400430051336 2 IN IP4 127.0.0.1', 's=-', 't=0 0',
+             'a=group:BUNDLE 0', 'a=extmap-allow-mixed', 'a=msid-semantic: WMS stream',
+             'm=audio 9 UDP/TLS/RTP/SAVPF 111 63 9 0 8 13 110 126', 'c=IN IP4 0.0.0.0',
+             'a=rtcp:9 IN IP4 0.0.0.0', 'a=ice-ufrag:8hhY', 'a=ice-pwd:asd88fgpdd777uzjYhagZg',
+             'a=ice-options:trickle',
+             'a=fingerprint:sha-256 D1:2C:BE:AD:C4:F6:64:5C:25:16:11:9C:AF:E7:0F:73:79:36:4E:9C:1E:15:54:39:0C:06:8B:ED:96:86:00:39',
+             f'a=setup:{"actpass" if kind == "offer" else "active"}', 'a=mid:0',
+             'a=extmap:1 urn:ietf:params:rtp-hdrext:ssrc-audio-level',
+             'a=extmap:2 http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time',
+             'a=extmap:3 http://www.ietf.org/id/draft-holmer-rmcat-transport-wide-cc-extensions-01',
+             'a=extmap:4 urn:ietf:params:rtp-hdrext:sdes:mid',
+             'a=sendrecv', 'a=msid:stream 3f1b2a4c-7d6e-4f5a-9b8c-1d2e3f4a5b6c', 'a=rtcp-mux',
+             'a=rtpmap:111 opus/48000/2', 'a=rtcp-fb:111 transport-cc',
+             'a=fmtp:111 minptime=10;useinbandfec=1', 'a=rtpmap:63 red/48000/2', 'a=fmtp:63 111/111',
+             'a=rtpmap:9 G722/8000', 'a=rtpmap:0 PCMU/8000', 'a=rtpmap:8 PCMA/8000',
+             'a=rtpmap:13 CN/8000', 'a=rtpmap:110 telephone-event/48000',
+             'a=rtpmap:126 telephone-event/8000', 'a=ssrc:1001 cname:4TOk42mSjXCkVIa6',
+             'a=ssrc:1001 msid:stream 3f1b2a4c-7d6e-4f5a-9b8c-1d2e3f4a5b6c']
+    return {'type': kind, 'sdp': '\r\n'.join(lines) + '\r\n'}
+
+
+def _member_window(count):
+    statuses = ('online', 'idle', 'dnd')
+    return {
+        'server_id': 42,
+        'total': 5000,
+        'start': 0,
+        'groups': [
+            {'id': 'owner', 'count': 1, 'offset': 0},
+            {'id': 'admin', 'count': 12, 'offset': 1},
+            {'id': 'online', 'count': 1800, 'offset': 13},
+            {'id': 'offline', 'count': 3187, 'offset': 1813},
+        ],
+        'members': [{
+            'user_id': 1000 + i, 'username': f'member_{i:04d}',
+            'status': statuses[i % 3], 'group': 'online',
+        } for i in range(count)],
+    }
+
+
+EVENTS = [
+    ('user_joined', {'user_id': 1234}),
+    ('incoming_call', {'user_id': 1234, 'username': 'alice_wonder'}),
+    ('ice_candidate', {'candidate': {
+        'candidate': 'candidate:842163049 1 udp 1677729535 203.0.113.7 61563 typ srflx '
+                     'raddr 192.168.1.20 rport 61563 generation 0 ufrag 8hhY network-cost 999',
+        'sdpMid': '0', 'sdpMLineIndex': 0, 'usernameFragment': '8hhY'}, 'user_id': 1234}),
+    ('channel_offer', {'offer': _sdp('offer'), 'user_id': 1234, 'channel_id': 17}),
+    ('answer', {'answer': _sdp('answer'), 'user_id': 1234}),
+    ('notification', {
+        'id': '1195783463378432001', 'reason': 'mention', 'message_kind': 'channel',
+        'message_id': '1195783463374237696', 'channel_id': 17, 'server_id': 42,
+        'actor_id': 1234, 'actor': 'alice_wonder',
+        'preview': 'hey @bob, are you joining the voice channel tonight?',
+        'created_at': '2026-10-18T19:42:07.123456'}),
+    ('member_list_sync', _member_window(100)),
+]
+
+
+def _wire_bytes(encoded):
+    if isinstance(encoded, list):
+        return sum(len(part) for part in encoded)
+    return len(encoded)
+
+
+def _json_packet(event, payload):
+    return packet.Packet(packet.EVENT, data=[event, payload], namespace='/').encode()
+
+
+def _binary_packet(event, payload):
+    return packet.Packet(packet.EVENT, data=[event, wire_format._binary_payload(payload)], namespace='/').encode()
+
+
+def _decode(encoded):
+    if isinstance(encoded, list):
+        received = packet.Packet(encoded_packet=encoded[0])
+        for attachment in encoded[1:]:
+            received.add_attachment(attachment)
+    else:
+        received = packet.Packet(encoded_packet=encoded)
+    return wire_format.decode(received.data[1])
+
+
+def _time(function, rounds):
+    began = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - began) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    if wire_format.msgpack is None:
+        sys.exit('msgpack is not installed')
+
+    print(f"{'event':<18} {'json B':>8} {'msgpack B':>10} {'saved':>7} "
+          f"{'json enc/dec us':>16} {'msgpack enc/dec us':>19}")
+    total_json = total_binary = 0
+    for event, payload in EVENTS:
+        json_encoded = _json_packet(event, payload)
+        binary_encoded = _binary_packet(event, payload)
+        assert _decode(json_encoded) == payload and _decode(binary_encoded) == payload, event
+
+        json_bytes, binary_bytes = _wire_bytes(json_encoded), _wire_bytes(binary_encoded)
+        total_json += json_bytes
+        total_binary += binary_bytes
+
+        json_enc = _time(lambda: _json_packet(event, payload), args.rounds)
+        json_dec = _time(lambda: _decode(json_encoded), args.rounds)
+        binary_enc = _time(lambda: _binary_packet(event, payload), args.rounds)
+        binary_dec = _time(lambda: _decode(binary_encoded), args.rounds)
+
+        print(f"{event:<18} {json_bytes:>8} {binary_bytes:>10} {1 - binary_bytes / json_bytes:>7.0%} "
+              f"{json_enc:>7.1f} /{json_dec:>7.1f} {binary_enc:>9.1f} /{binary_dec:>7.1f}")
+
+    print(f"{'all events':<18} {total_json:>8} {total_binary:>10} {1 - total_binary / total_json:>7.0%}")
+
+
+if __name__ == '__main__':
+    main()
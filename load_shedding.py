@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+from collections import deque, OrderedDict
+from itertools import islice
+from functools import wraps
+from flask import g, jsonify, make_response, request
+
+# How often the event loop lag is sampled, and how many samples are kept
+# for the percentiles reported by /metrics (about a minute)
+LAG_SAMPLE_INTERVAL = 0.05
+LAG_SAMPLE_WINDOW = 1200
+
+# Samples (about half a second) whose total lag decides whether the loop is
+# overloaded right now. Summing catches a steady stream of moderately slow
+# requests that never stalls the loop long enough on its own.
+RECENT_LAG_SAMPLES = 10
+
+
+def _percentile(samples, q):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class LoadMonitor:
+    """Event loop lag sampler and admission controller.
+
+    Everything runs in a single gevent worker, so a slow request delays every
+    socket. A background task sleeps for a fixed interval and records how
+    late it wakes up. While that lag, or the number of in-flight HTTP
+    requests, is over its threshold, low-priority work is shed: marked routes
+    answer 503 with Retry-After and presence broadcasts are deferred until
+    the load drops. Socket.IO signaling handlers are never shed.
+
+    In ASGI mode background tasks are threads, so asgi.py samples the
+    asyncio loop's lag instead through start_asyncio().
+    """
+
+    def __init__(self):
+        self.lag_samples = deque(maxlen=LAG_SAMPLE_WINDOW)
+        self.in_flight = 0
+        self.shed_counts = {}
+        self.deferred = OrderedDict()
+        self.deferred_total = 0
+        self.flushed_total = 0
+
+        self.enabled = True
+        self.lag_threshold = 0.1
+        self.max_in_flight = 32
+        self.retry_after = 2
+
+        self._socketio = None
+        self._last_wake = None
+        self._started = False
+        self._asyncio_sampler = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, socketio):
+        self.enabled = app.config.get('LOAD_SHEDDING_ENABLED', True)
+        self.lag_threshold = app.config.get('LOAD_SHED_LAG_MS', 100) / 1000.0
+        self.max_in_flight = app.config.get('LOAD_SHED_MAX_IN_FLIGHT', 32)
+        self.retry_after = app.config.get('LOAD_SHED_RETRY_AFTER', 2)
+        self._socketio = socketio
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        # Started on the first request so CLI commands never spawn the sampler
+        if not self._started:
+            with self._lock:
+                if not self._started:
+                    self._started = True
+                    self._socketio.start_background_task(self._sample_lag)
+        self.in_flight += 1
+        g.load_monitor_counted = True
+
+    def _teardown_request(self, exc):
+        if g.pop('load_monitor_counted', False):
+            self.in_flight -= 1
+
+    def start_asyncio(self, loop):
+        """Sample an asyncio loop instead of the Socket.IO background task."""
+        with self._lock:
+            self._started = True
+        # The loop only keeps a weak reference to its tasks
+        self._asyncio_sampler = loop.create_task(self._sample_asyncio_lag())
+
+    def _sample_lag(self):
+        while True:
+            started = time.monotonic()
+            self._socketio.sleep(LAG_SAMPLE_INTERVAL)
+            self._woke(started)
+
+    async def _sample_asyncio_lag(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+            self._woke(started)
+
+    def _woke(self, started):
+        self._last_wake = time.monotonic()
+        self.lag_samples.append(max(0.0, self._last_wake - started - LAG_SAMPLE_INTERVAL))
+
+        if self.deferred and not self.overloaded():
+            self.flush_deferred()
+
+    def recent_lag(self):
+        # A sampler that is overdue right now counts too, so a burst of slow
+        # requests is caught before the loop gets around to recording it
+        overdue = 0.0
+        if self._last_wake is not None:
+            overdue = time.monotonic() - self._last_wake - LAG_SAMPLE_INTERVAL
+        return max(0.0, overdue) + sum(islice(reversed(self.lag_samples), RECENT_LAG_SAMPLES))
+
+    def overloaded(self):
+        if not self.enabled:
+            return False
+        return self.recent_lag() > self.lag_threshold or self.in_flight > self.max_in_flight
+
+    def record_shed(self, kind):
+        self.shed_counts[kind] = self.shed_counts.get(kind, 0) + 1
+
+    def defer(self, key, callback):
+        """Run callback now, or later if the server is overloaded.
+
+        Callbacks deferred under the same key are coalesced, so only the
+        latest one runs when the load drops.
+        """
+        if key in self.deferred or self.overloaded():
+            if key not in self.deferred:
+                self.deferred_total += 1
+                self.record_shed('deferred_broadcast')
+            self.deferred[key] = callback
+            return
+        callback()
+
+    def flush_deferred(self):
+        while self.deferred and not self.overloaded():
+            _, callback = self.deferred.popitem(last=False)
+            self.flushed_total += 1
+            try:
+                callback()
+            except Exception as e:
+                print(f"Deferred broadcast failed: {e}")
+
+    def metrics(self):
+        samples = list(self.lag_samples)
+        return {
+            'loop_lag_ms': {
+                'p50': round(_percentile(samples, 0.50) * 1000, 2),
+                'p95': round(_percentile(samples, 0.95) * 1000, 2),
+                'p99': round(_percentile(samples, 0.99) * 1000, 2),
+                'max': round(max(samples, default=0.0) * 1000, 2),
+                'recent': round(self.recent_lag() * 1000, 2),
+                'samples': len(samples),
+            },
+            'in_flight': self.in_flight,
+            'overloaded': self.overloaded(),
+            'shed': dict(self.shed_counts),
+            'deferred_pending': len(self.deferred),
+            'deferred_total': self.deferred_total,
+            'deferred_flushed': self.flushed_total,
+        }
+
+
+load_monitor = LoadMonitor()
+
+
+def shed_when_overloaded(view):
+    """Reject a low-priority route with 503 + Retry-After while overloaded."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if load_monitor.overloaded():
+            load_monitor.record_shed(request.endpoint)
+            if request.path.startswith('/api/'):
+                response = make_response(jsonify({'error': 'Server is busy, please try again shortly'}), 503)
+            else:
+                response = make_response('Server is busy, please try again shortly', 503)
+            response.headers['Retry-After'] = str(load_monitor.retry_after)
+            return response
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,370 @@
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from flask import send_file, url_for
+from sqlalchemy.exc import IntegrityError
+from models import (db, User, Server, ServerMember, Channel, Message, DirectMessage, MediaBlob, MediaUpload,
+                    Attachment)
+from archive import dm_scope
+
+try:
+    from PIL import Image
+except ImportError:
+    # Without Pillow uploads still work; images are just served full size
+    Image = None
+
+# Bytes read from an upload per step, so memory use per upload is constant
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Thumbnail buckets in pixels; a requested size is rounded up to the next one
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+THUMBNAIL_WORKERS = 2
+
+# Images larger than this are never decoded for thumbnails
+THUMBNAIL_MAX_PIXELS = 50_000_000
+
+# Stored files never change under a digest, so clients can cache them forever
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+
+THUMBNAIL_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'image/bmp'}
+
+# Anything else is served as a download, so uploaded HTML or SVG never runs
+# on the app's origin
+INLINE_TYPE_PREFIXES = ('audio/', 'video/')
+INLINE_TYPES = THUMBNAIL_TYPES | {'application/pdf', 'text/plain'}
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# Leading bytes of each image type, so a file only counts as an image if
+# its content agrees with the type it was uploaded as
+_IMAGE_SIGNATURES = {
+    'image/png': (b'\x89PNG\r\n\x1a\n',),
+    'image/jpeg': (b'\xff\xd8\xff',),
+    'image/gif': (b'GIF87a', b'GIF89a'),
+    'image/webp': (b'RIFF',),
+    'image/bmp': (b'BM',),
+}
+
+
+def is_digest(value):
+    return bool(value) and bool(_DIGEST_RE.match(value))
+
+
+def thumbnail_bucket(size):
+    for bucket in THUMBNAIL_SIZES:
+        if size <= bucket:
+            return bucket
+    return None
+
+
+def _threading_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        # The ASGI deployment runs without gevent
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def media_url(digest, size=None):
+    """URL of a stored file, or None for legacy values such as 'default.png'."""
+    if not is_digest(digest):
+        return None
+    if size:
+        return url_for('media', digest=digest, size=size)
+    return url_for('media', digest=digest)
+
+
+class MediaStore:
+    """Content-addressed file store in the instance folder.
+
+    Uploads are streamed to a temporary file in fixed-size chunks while
+    being hashed, then moved to uploads/ab/cd/<sha256>. Identical content
+    is stored once however many times it is uploaded. Image thumbnails are
+    rendered by a small worker pool after the upload has been answered.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.max_upload_size = 25 * 1024 * 1024
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.root = app.config.get('UPLOAD_FOLDER') or os.path.join(app.instance_path, 'uploads')
+        self.max_upload_size = app.config.get('MAX_UPLOAD_SIZE', self.max_upload_size)
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def thumbnail_path(self, digest, size):
+        return os.path.join(self.root, 'thumbs', str(size), digest[:2], digest[2:4], f'{digest}.png')
+
+    def save(self, stream, filename=None, content_type=None):
+        """Store an upload from a file-like stream and return its MediaBlob.
+
+        Raises ValueError if the upload is empty or larger than the limit.
+        The blob is added to the session; the caller commits.
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_upload_size:
+                        raise ValueError(f'Uploads are limited to {self.max_upload_size // (1024 * 1024)} MB')
+                    hasher.update(chunk)
+                    f.write(chunk)
+            if size == 0:
+                raise ValueError('Uploaded file is empty')
+
+            digest = hasher.hexdigest()
+            final_path = self.path(digest)
+            if os.path.exists(final_path):
+                # Already stored; the new copy is redundant
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        blob = db.session.get(MediaBlob, digest)
+        if blob is None:
+            content_type = content_type or mimetypes.guess_type(filename or '')[0] or 'application/octet-stream'
+            try:
+                with db.session.begin_nested():
+                    blob = MediaBlob(digest=digest, size=size, content_type=content_type)
+                    db.session.add(blob)
+            except IntegrityError:
+                # Someone stored the same content at the same moment
+                blob = db.session.get(MediaBlob, digest)
+
+        if blob.content_type in THUMBNAIL_TYPES:
+            self.schedule_thumbnails(digest)
+        return blob
+
+    def is_image(self, blob):
+        """Whether a stored blob is an image of a type thumbnails are made for."""
+        signatures = _IMAGE_SIGNATURES.get(blob.content_type)
+        if not signatures:
+            return False
+        with open(self.path(blob.digest), 'rb') as f:
+            header = f.read(12)
+        if blob.content_type == 'image/webp' and header[8:12] != b'WEBP':
+            return False
+        return header.startswith(signatures)
+
+    # ====================
+    # THUMBNAILS
+    # ====================
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if _threading_patched():
+                        # Patched threads are greenlets; image decoding would
+                        # block the event loop, so use real OS threads
+                        from gevent.threadpool import ThreadPoolExecutor
+                    else:
+                        from concurrent.futures import ThreadPoolExecutor
+                    self._executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+        return self._executor
+
+    def schedule_thumbnails(self, digest):
+        if Image is None:
+            return
+        if all(os.path.exists(self.thumbnail_path(digest, size)) for size in THUMBNAIL_SIZES):
+            return
+        with self._lock:
+            if digest in self._pending:
+                return
+            self._pending.add(digest)
+        self._get_executor().submit(self._render_thumbnails, digest)
+
+    def _render_thumbnails(self, digest):
+        try:
+            with Image.open(self.path(digest)) as image:
+                if image.width * image.height > THUMBNAIL_MAX_PIXELS:
+                    return
+                # Lets JPEG decode at a reduced scale instead of full size
+                image.draft('RGB', (THUMBNAIL_SIZES[-1], THUMBNAIL_SIZES[-1]))
+                if image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+                    image = image.convert('RGB')
+
+                # Largest bucket first, each one scaled down from the last
+                current = image
+                for size in reversed(THUMBNAIL_SIZES):
+                    thumbnail = current.copy()
+                    thumbnail.thumbnail((size, size))
+                    current = thumbnail
+
+                    path = self.thumbnail_path(digest, size)
+                    if os.path.exists(path):
+                        continue
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+                    thumbnail.save(tmp_path, format='PNG', optimize=True)
+                    os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Thumbnail generation failed for {digest}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(digest)
+
+    # ====================
+    # SERVING
+    # ====================
+
+    def send(self, digest, size=None, public=True):
+        """Response for a stored file or one of its thumbnails, or None if unknown.
+
+        Responses carry the digest as a strong ETag and answer conditional
+        and range requests. Non-public files may only be cached by the
+        browser that fetched them.
+        """
+        if not is_digest(digest):
+            return None
+        blob = db.session.get(MediaBlob, digest)
+        if blob is None or not os.path.exists(self.path(digest)):
+            return None
+
+        path, mimetype, etag = self.path(digest), blob.content_type, digest
+        immutable = True
+        bucket = thumbnail_bucket(size) if size and blob.content_type in THUMBNAIL_TYPES else None
+        if bucket:
+            thumbnail_path = self.thumbnail_path(digest, bucket)
+            if os.path.exists(thumbnail_path):
+                path, mimetype, etag = thumbnail_path, 'image/png', f'{digest}-{bucket}'
+            else:
+                # Serve the original until the thumbnail exists, without
+                # letting clients cache it under the thumbnail URL
+                self.schedule_thumbnails(digest)
+                immutable = False
+
+        inline = mimetype in INLINE_TYPES or mimetype.startswith(INLINE_TYPE_PREFIXES)
+        response = send_file(
+            path, mimetype=mimetype if inline else 'application/octet-stream',
+            as_attachment=not inline, download_name=digest,
+            conditional=True, etag=etag, max_age=MEDIA_MAX_AGE if immutable else 0)
+        if immutable:
+            visibility = 'public' if public else 'private'
+            response.headers['Cache-Control'] = f'{visibility}, max-age={MEDIA_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+
+media_store = MediaStore()
+
+
+def serialize_attachment(attachment, content_type):
+    return {
+        'digest': attachment.digest,
+        'filename': attachment.filename,
+        'content_type': content_type,
+        'url': media_url(attachment.digest),
+        'thumbnail_url': media_url(attachment.digest, 256) if content_type in THUMBNAIL_TYPES else None,
+    }
+
+
+def attachment_scope(kind, message):
+    if kind == 'dm':
+        return dm_scope(message.sender_id, message.recipient_id)
+    return str(message.channel_id)
+
+
+def record_upload(digest, user_id):
+    """Remember that user_id uploaded digest through /api/media; the caller commits."""
+    if db.session.query(MediaUpload.id).filter_by(uploader_id=user_id, digest=digest).first() is None:
+        db.session.add(MediaUpload(digest=digest, uploader_id=user_id))
+
+
+def uploaded_by(digest, user_id):
+    """Whether user_id uploaded digest themselves and so may attach it by digest."""
+    return (db.session.query(MediaUpload.id).filter_by(uploader_id=user_id, digest=digest).first() is not None or
+            db.session.query(Attachment.id).filter_by(uploader_id=user_id, digest=digest).first() is not None)
+
+
+def media_visibility(digest, user_id):
+    """'public' for avatars and server icons, 'private' for attachments
+    user_id can see, or None if the file must not be served to them.
+
+    Uploads that aren't an avatar, an icon or attached to a message yet are
+    not served at all.
+    """
+    if (db.session.query(User.id).filter_by(avatar=digest).first() or
+            db.session.query(Server.id).filter_by(icon=digest).first()):
+        return 'public'
+    if not user_id:
+        return None
+
+    channel_ids = []
+    for kind, scope, uploader_id in db.session.query(
+            Attachment.message_kind, Attachment.scope, Attachment.uploader_id).filter_by(digest=digest).all():
+        if uploader_id == user_id:
+            return 'private'
+        if scope is None:
+            continue
+        if kind == 'dm':
+            if str(user_id) in scope.split(':'):
+                return 'private'
+        else:
+            channel_ids.append(int(scope))
+
+    if channel_ids and db.session.query(ServerMember.id).join(
+            Channel, Channel.server_id == ServerMember.server_id).filter(
+            Channel.id.in_(channel_ids), ServerMember.user_id == user_id).first():
+        return 'private'
+    return None
+
+
+def backfill_attachment_scopes():
+    """Set the scope of attachments stored before it was recorded.
+
+    Attachments whose message has already been archived keep no scope and
+    stay visible to their uploader only.
+    """
+    updated = 0
+    for kind, model in (('channel', Message), ('dm', DirectMessage)):
+        rows = db.session.query(Attachment, model).join(model, model.id == Attachment.message_id).filter(
+            Attachment.message_kind == kind, Attachment.scope.is_(None)).all()
+        for attachment, message in rows:
+            attachment.scope = attachment_scope(kind, message)
+            updated += 1
+    db.session.commit()
+    return updated
+
+
+def attachments_by_message(kind, message_ids):
+    """{message id: [attachment dicts]} for a page of messages."""
+    if not message_ids:
+        return {}
+    rows = db.session.query(Attachment, MediaBlob.content_type).join(
+        MediaBlob, MediaBlob.digest == Attachment.digest).filter(
+        Attachment.message_kind == kind, Attachment.message_id.in_(message_ids)).order_by(Attachment.id).all()
+    attachments = {}
+    for attachment, content_type in rows:
+        attachments.setdefault(attachment.message_id, []).append(serialize_attachment(attachment, content_type))
+    return attachments
+
+
+def attach_files(rows, kind):
+    attachments = attachments_by_message(kind, [row['id'] for row in rows])
+    for row in rows:
+        row['attachments'] = attachments.get(row['id'], [])
+    return rows
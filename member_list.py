@@ -0,0 +1,276 @@
+import threading
+from bisect import bisect_left, insort
+from flask import session, request
+from models import db, User, ServerMember
+from load_shedding import load_monitor
+from wire_format import accepts_binary, emit_event
+
+# Members returned per window when the client doesn't ask for a size
+MEMBER_WINDOW_SIZE = 100
+MAX_MEMBER_WINDOW_SIZE = 200
+
+# Sidebar sections, top to bottom. Members who aren't offline are grouped
+# by role; everyone offline shares a single section at the bottom.
+MEMBER_GROUPS = ['owner', 'admin', 'member', 'offline']
+_GROUP_RANK = {group: rank for rank, group in enumerate(MEMBER_GROUPS)}
+
+
+def member_group(role, status):
+    if status == 'offline' or not status:
+        return 'offline'
+    return role if role in _GROUP_RANK else 'member'
+
+
+class MemberIndex:
+    """Sorted in-memory member list for one server.
+
+    Entries are (group rank, lowercase username, user id) tuples kept in
+    sidebar order, so a window is a slice and every change is one bisect.
+    """
+
+    def __init__(self, server_id):
+        self.server_id = server_id
+        self.entries = []
+        self.members = {}
+        self.group_counts = dict.fromkeys(MEMBER_GROUPS, 0)
+        self.lock = threading.Lock()
+
+    def _key(self, member):
+        group = member_group(member['role'], member['status'])
+        return (_GROUP_RANK[group], member['username'].lower(), member['user_id'])
+
+    def _insert(self, member):
+        key = self._key(member)
+        self.members[member['user_id']] = member
+        self.group_counts[MEMBER_GROUPS[key[0]]] += 1
+        insort(self.entries, key)
+        return bisect_left(self.entries, key)
+
+    def _remove(self, user_id):
+        member = self.members.pop(user_id)
+        key = self._key(member)
+        position = bisect_left(self.entries, key)
+        del self.entries[position]
+        self.group_counts[MEMBER_GROUPS[key[0]]] -= 1
+        return member, position
+
+    def load(self, rows):
+        for user_id, username, role, status in rows:
+            member = {'user_id': user_id, 'username': username, 'role': role or 'member', 'status': status or 'offline'}
+            self.members[user_id] = member
+            self.group_counts[member_group(member['role'], member['status'])] += 1
+        self.entries = sorted(self._key(member) for member in self.members.values())
+
+    def add(self, user_id, username, role, status):
+        """Add a member, returning the position they were inserted at."""
+        with self.lock:
+            if user_id in self.members:
+                return None
+            return self._insert({'user_id': user_id, 'username': username, 'role': role, 'status': status or 'offline'})
+
+    def remove(self, user_id):
+        """Remove a member, returning the position they were removed from."""
+        with self.lock:
+            if user_id not in self.members:
+                return None
+            return self._remove(user_id)[1]
+
+    def update(self, user_id, **changes):
+        """Change a member's status or role, returning (old, new) positions."""
+        with self.lock:
+            if user_id not in self.members:
+                return None
+            member, old_position = self._remove(user_id)
+            member = dict(member, **changes)
+            return old_position, self._insert(member)
+
+    def __contains__(self, user_id):
+        return user_id in self.members
+
+    def window(self, start, count):
+        with self.lock:
+            keys = self.entries[start:start + count]
+            members = []
+            for rank, _, user_id in keys:
+                member = self.members[user_id]
+                members.append({
+                    'user_id': user_id,
+                    'username': member['username'],
+                    'status': member['status'],
+                    'group': MEMBER_GROUPS[rank],
+                })
+
+            groups = []
+            offset = 0
+            for group in MEMBER_GROUPS:
+                groups.append({'id': group, 'count': self.group_counts[group], 'offset': offset})
+                offset += self.group_counts[group]
+
+            return {
+                'server_id': self.server_id,
+                'total': len(self.entries),
+                'start': start,
+                'groups': groups,
+                'members': members,
+            }
+
+
+# Indexes are built on first use and then kept current incrementally
+_indexes = {}
+_user_servers = {}
+_indexes_lock = threading.Lock()
+
+# server_id -> {sid: (start, end)} for clients watching part of the list
+_subscriptions = {}
+_sid_servers = {}
+_sid_users = {}
+
+_socketio = None
+
+
+def get_member_index(server_id):
+    index = _indexes.get(server_id)
+    if index is not None:
+        return index
+
+    with _indexes_lock:
+        index = _indexes.get(server_id)
+        if index is None:
+            # Only the columns the sidebar needs, never full User rows
+            rows = db.session.query(
+                ServerMember.user_id, User.username, ServerMember.role, User.status
+            ).join(User, User.id == ServerMember.user_id).filter(ServerMember.server_id == server_id).all()
+            index = MemberIndex(server_id)
+            index.load(rows)
+            for user_id, _, _, _ in rows:
+                _user_servers.setdefault(user_id, set()).add(server_id)
+            _indexes[server_id] = index
+    return index
+
+
+def member_index_for(server_id, user_id):
+    """The server's member index if user_id is a member, otherwise None.
+
+    Membership is checked against the database before an index is built,
+    so requests for servers the user can't see never build or cache one.
+    """
+    index = _indexes.get(server_id)
+    if index is None:
+        is_member = db.session.query(ServerMember.id).filter_by(server_id=server_id, user_id=user_id).first()
+        if is_member is None:
+            return None
+        index = get_member_index(server_id)
+    return index if user_id in index else None
+
+
+# server_id -> first changed position of broadcasts held back under load
+_deferred_changes = {}
+
+
+def _broadcast_change(server_id, positions):
+    if not _subscriptions.get(server_id) or _socketio is None:
+        return
+    # Presence updates are low priority; under load they are coalesced per
+    # server and sent once the event loop catches up
+    first_changed = min(positions)
+    _deferred_changes[server_id] = min(first_changed, _deferred_changes.get(server_id, first_changed))
+    load_monitor.defer(('member_list', server_id), lambda: _send_change(server_id))
+
+
+def _send_change(server_id):
+    first_changed = _deferred_changes.pop(server_id, None)
+    subscribers = _subscriptions.get(server_id)
+    if first_changed is None or not subscribers:
+        return
+    # Only clients whose visible window starts after the change are unaffected
+    index = _indexes[server_id]
+    for sid, (start, end) in list(subscribers.items()):
+        # Never send the list to someone who has since left the server
+        if _sid_users.get(sid) not in index:
+            unsubscribe_member_list(sid, server_id)
+            continue
+        if first_changed < end:
+            emit_event('member_list_sync', index.window(start, end - start), to=sid)
+
+
+def member_joined(server_id, user_id, username, role, status):
+    index = _indexes.get(server_id)
+    if index is None:
+        return
+    position = index.add(user_id, username, role, status)
+    if position is not None:
+        _user_servers.setdefault(user_id, set()).add(server_id)
+        _broadcast_change(server_id, [position])
+
+
+def member_left(server_id, user_id):
+    # The leaver's own sockets stop receiving the server's member list
+    for sid in [sid for sid in _subscriptions.get(server_id, ()) if _sid_users.get(sid) == user_id]:
+        unsubscribe_member_list(sid, server_id)
+
+    index = _indexes.get(server_id)
+    if index is None:
+        return
+    position = index.remove(user_id)
+    if position is not None:
+        _user_servers.get(user_id, set()).discard(server_id)
+        _broadcast_change(server_id, [position])
+
+
+def presence_changed(user_id, status):
+    for server_id in list(_user_servers.get(user_id, ())):
+        positions = _indexes[server_id].update(user_id, status=status)
+        if positions is not None:
+            _broadcast_change(server_id, positions)
+
+
+def subscribe_member_list(sid, user_id, data):
+    """Start sending sid updates for a window of a server's member list.
+
+    Returns the window to send now, or None if the user can't see the list.
+    """
+    if not user_id:
+        return None
+
+    server_id = int(data['server_id'])
+    index = member_index_for(server_id, user_id)
+    if index is None:
+        return None
+
+    start = max(0, int(data.get('start', 0)))
+    count = max(1, min(int(data.get('count', MEMBER_WINDOW_SIZE)), MAX_MEMBER_WINDOW_SIZE))
+
+    # A client watches one range per server; a new range replaces the old one
+    _subscriptions.setdefault(server_id, {})[sid] = (start, start + count)
+    _sid_servers.setdefault(sid, set()).add(server_id)
+    _sid_users[sid] = user_id
+    return index.window(start, count)
+
+
+def unsubscribe_member_list(sid, server_id=None):
+    """Stop updates for one server, or for every server when the socket disconnects."""
+    if server_id is not None:
+        _subscriptions.get(server_id, {}).pop(sid, None)
+        _sid_servers.get(sid, set()).discard(server_id)
+        return
+    for server_id in _sid_servers.pop(sid, ()):
+        _subscriptions.get(server_id, {}).pop(sid, None)
+    _sid_users.pop(sid, None)
+
+
+# Member List Event Handlers
+def register_member_list_events(socketio):
+    global _socketio
+    _socketio = socketio
+
+    @socketio.on('subscribe_member_list')
+    @accepts_binary
+    def handle_subscribe_member_list(data):
+        window = subscribe_member_list(request.sid, session.get('user_id'), data)
+        if window is not None:
+            emit_event('member_list_sync', window)
+
+    @socketio.on('unsubscribe_member_list')
+    @accepts_binary
+    def handle_unsubscribe_member_list(data):
+        unsubscribe_member_list(request.sid, int(data['server_id']))
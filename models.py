@@ -2,9 +2,12 @@ from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_security import UserMixin, RoleMixin
 import uuid
+from snowflake import next_id
 
 db = SQLAlchemy()
 
+MESSAGE_ID_TYPE = db.BigInteger().with_variant(db.Integer(), 'sqlite')
+
 # Association table for User-Roles many-to-many relationship
 roles_users = db.Table('roles_users',
     db.Column('user_id', db.Integer(), db.ForeignKey('users.id')),
@@ -29,7 +32,7 @@ class User(db.Model, UserMixin):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
     fs_uniquifier = db.Column(db.String(255), unique=True, nullable=False, default=lambda: uuid.uuid4().hex)
-    avatar = db.Column(db.String(255), default='default.png')
+    avatar = db.Column(db.String(255), default='default.png', index=True)
     status = db.Column(db.String(20), default='offline')  # online, offline, idle, dnd
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -49,7 +52,7 @@ class Server(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    icon = db.Column(db.String(255), default='default.png')
+    icon = db.Column(db.String(255), default='default.png', index=True)
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -70,8 +73,12 @@ class ServerMember(db.Model):
     role = db.Column(db.String(50), default='member')  # member, admin, owner
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Ensure a user can only join a server once
-    __table_args__ = (db.UniqueConstraint('user_id', 'server_id', name='unique_user_server'),)
+    # Ensure a user can only join a server once. The second index serves
+    # per-server scans such as @everyone fan-out and the member sidebar.
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'server_id', name='unique_user_server'),
+        db.Index('ix_server_members_server_id_user_id', 'server_id', 'user_id'),
+    )
 
 class Channel(db.Model):
     __tablename__ = 'channels'
@@ -97,29 +104,142 @@ class Channel(db.Model):
 class Message(db.Model):
     __tablename__ = 'messages'
     
-    id = db.Column(db.Integer, primary_key=True)
+    # Snowflake ids are generated in-process and sort by creation time.
+    # SQLite's INTEGER PRIMARY KEY is already 64-bit and is the rowid itself.
+    id = db.Column(MESSAGE_ID_TYPE, primary_key=True, autoincrement=False, default=next_id)
     content = db.Column(db.Text, nullable=False)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     channel_id = db.Column(db.Integer, db.ForeignKey('channels.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     edited_at = db.Column(db.DateTime)
     
+    # Recent-page and pagination queries walk a channel's history by id
+    __table_args__ = (db.Index('ix_messages_channel_id_id', 'channel_id', 'id'),)
+    
     def __repr__(self):
         return f'<Message {self.id}>'
 
 class DirectMessage(db.Model):
     __tablename__ = 'direct_messages'
     
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(MESSAGE_ID_TYPE, primary_key=True, autoincrement=False, default=next_id)
     content = db.Column(db.Text, nullable=False)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     recipient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_read = db.Column(db.Boolean, default=False)
     
+    __table_args__ = (db.Index('ix_direct_messages_pair_id', 'sender_id', 'recipient_id', 'id'),)
+    
     def __repr__(self):
         return f'<DirectMessage {self.id}>'
 
+class ArchivedMessageSegment(db.Model):
+    __tablename__ = 'archived_message_segments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # channel, dm
+    scope = db.Column(db.String(64), nullable=False)  # channel id, or "low:high" user ids for DMs
+    month = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    min_id = db.Column(db.BigInteger, nullable=False)
+    max_id = db.Column(db.BigInteger, nullable=False)
+    message_count = db.Column(db.Integer, default=0)
+    payload = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed JSON list of messages
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # One segment per channel (or DM pair) per month
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'scope', 'month', name='unique_segment_month'),
+        db.Index('ix_archived_segments_scope_max_id', 'kind', 'scope', 'max_id'),
+    )
+    
+    def __repr__(self):
+        return f'<ArchivedMessageSegment {self.kind}:{self.scope} {self.month}>'
+
+class MediaBlob(db.Model):
+    __tablename__ = 'media_blobs'
+    
+    # Uploaded files are stored once per distinct content, keyed by SHA-256
+    digest = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    content_type = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MediaBlob {self.digest[:12]}>'
+
+class MediaUpload(db.Model):
+    __tablename__ = 'media_uploads'
+    
+    # Blobs are shared by everyone who uploads the same content, so who
+    # uploaded a file through /api/media is recorded per user; only they
+    # may attach it by digest
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), db.ForeignKey('media_blobs.digest'), nullable=False)
+    uploader_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('uploader_id', 'digest', name='uq_media_uploads_uploader_digest'),
+    )
+    
+    def __repr__(self):
+        return f'<MediaUpload {self.digest[:12]}>'
+
+class Attachment(db.Model):
+    __tablename__ = 'attachments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), db.ForeignKey('media_blobs.digest'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    uploader_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # No foreign key on the message: archived messages leave the hot tables
+    message_kind = db.Column(db.String(20), nullable=False)  # channel, dm
+    message_id = db.Column(db.BigInteger, nullable=False)
+    # Who may download the file: channel id, or "low:high" user ids for DMs,
+    # as in archived segments
+    scope = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_attachments_message', 'message_kind', 'message_id'),
+        db.Index('ix_attachments_digest', 'digest'),
+    )
+    
+    def __repr__(self):
+        return f'<Attachment {self.filename}>'
+
+class Notification(db.Model):
+    __tablename__ = 'notifications'
+    
+    # Snowflake ids double as the per-user catch-up cursor
+    id = db.Column(MESSAGE_ID_TYPE, primary_key=True, autoincrement=False, default=next_id)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    reason = db.Column(db.String(20), nullable=False)  # mention, everyone, here, dm
+    message_kind = db.Column(db.String(20), nullable=False)  # channel, dm
+    message_id = db.Column(db.BigInteger, nullable=False)
+    channel_id = db.Column(db.Integer)
+    server_id = db.Column(db.Integer)
+    actor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    preview = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_notifications_user_id_id', 'user_id', 'id'),)
+    
+    def __repr__(self):
+        return f'<Notification {self.id} for {self.user_id}>'
+
+class NotificationCursor(db.Model):
+    __tablename__ = 'notification_cursors'
+    
+    # Everything up to last_read_id has been seen by the user
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    last_read_id = db.Column(db.BigInteger, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<NotificationCursor {self.user_id} at {self.last_read_id}>'
+
 class Friend(db.Model):
     __tablename__ = 'friends'
     
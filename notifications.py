@@ -0,0 +1,270 @@
+import re
+import threading
+from datetime import datetime
+from models import db, User, ServerMember, Notification, NotificationCursor
+from snowflake import get_generator
+from wire_format import emit_event
+
+# Recipients resolved and rows inserted per statement while fanning out
+NOTIFICATION_BATCH_SIZE = 1000
+
+# Notifications returned per catch-up page
+NOTIFICATION_PAGE_SIZE = 50
+
+PREVIEW_LENGTH = 100
+
+# "@name" at the start of the text or after whitespace; trailing punctuation
+# is not part of the name
+_MENTION_RE = re.compile(r'(?<!\S)@([^\s@]+)')
+_TRAILING_PUNCTUATION = '.,!?:;)\'"'
+
+
+def parse_mentions(content):
+    """Return (usernames, everyone, here) mentioned in a message."""
+    usernames = set()
+    everyone = here = False
+    for match in _MENTION_RE.finditer(content):
+        name = match.group(1).rstrip(_TRAILING_PUNCTUATION)
+        if name == 'everyone':
+            everyone = True
+        elif name == 'here':
+            here = True
+        elif name:
+            usernames.add(name)
+    return usernames, everyone, here
+
+
+# ====================
+# ONLINE USERS
+# ====================
+
+# user_id -> sids connected to this process
+_online = {}
+_sid_users = {}
+
+
+def user_connected(user_id, sid):
+    _online.setdefault(user_id, set()).add(sid)
+    _sid_users[sid] = user_id
+
+
+def user_disconnected(sid):
+    user_id = _sid_users.pop(sid, None)
+    sids = _online.get(user_id)
+    if sids is not None:
+        sids.discard(sid)
+        if not sids:
+            del _online[user_id]
+
+
+def user_room(user_id):
+    return f'user_{user_id}'
+
+
+# ====================
+# FAN-OUT WORKER
+# ====================
+
+_jobs = None
+_app = None
+_socketio = None
+_worker_started = False
+_worker_lock = threading.Lock()
+
+
+def init_app(app, socketio):
+    global _app, _socketio, _jobs
+    _app = app
+    _socketio = socketio
+    # A queue of the server's async mode (gevent's when running under
+    # gevent), so waiting on it yields to other greenlets even when the
+    # standard library isn't monkey-patched
+    _jobs = socketio.server.eio.create_queue()
+
+
+def _enqueue(job):
+    global _worker_started
+    # Started on first use so CLI commands never spawn the worker
+    if not _worker_started:
+        with _worker_lock:
+            if not _worker_started:
+                _worker_started = True
+                _socketio.start_background_task(_worker)
+    _jobs.put(job)
+
+
+def notify_channel_message(message, server_id):
+    """Queue mention notifications for a channel message.
+
+    Only the job is queued here; resolving and writing recipients happens
+    in the background, so the sender's request doesn't grow with the
+    audience.
+    """
+    if '@' not in message.content:
+        return
+    _enqueue({
+        'kind': 'channel', 'message_id': message.id, 'channel_id': message.channel_id,
+        'server_id': server_id, 'author_id': message.author_id, 'content': message.content,
+    })
+
+
+def notify_direct_message(message):
+    # Notes to yourself don't notify you
+    if message.sender_id == message.recipient_id:
+        return
+    _enqueue({
+        'kind': 'dm', 'message_id': message.id, 'recipient_id': message.recipient_id,
+        'author_id': message.sender_id, 'content': message.content,
+    })
+
+
+def wait_until_idle():
+    """Wait until every queued job has been delivered.
+
+    Under gevent this only blocks the calling greenlet.
+    """
+    _jobs.join()
+
+
+def _worker():
+    while True:
+        job = _jobs.get()
+        try:
+            with _app.app_context():
+                try:
+                    _fan_out(job)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Notification fan-out failed: {e}")
+        finally:
+            _jobs.task_done()
+        # Don't starve sockets while working through a backlog of jobs
+        _socketio.sleep(0)
+
+
+def _member_batches(server_id, author_id, exclude, online_only=False):
+    # Keyset pagination rather than a streaming cursor, because every batch
+    # is committed before the next one is read
+    if online_only:
+        # Snapshot first: in ASGI mode sockets connect on another thread
+        candidates = sorted(user_id for user_id in list(_online) if user_id != author_id and user_id not in exclude)
+        for offset in range(0, len(candidates), NOTIFICATION_BATCH_SIZE):
+            chunk = candidates[offset:offset + NOTIFICATION_BATCH_SIZE]
+            rows = db.session.query(ServerMember.user_id).filter(
+                ServerMember.server_id == server_id, ServerMember.user_id.in_(chunk)).all()
+            yield [row[0] for row in rows]
+        return
+
+    last_id = 0
+    while True:
+        rows = db.session.query(ServerMember.user_id).filter(
+            ServerMember.server_id == server_id, ServerMember.user_id > last_id
+        ).order_by(ServerMember.user_id).limit(NOTIFICATION_BATCH_SIZE).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [row[0] for row in rows if row[0] != author_id and row[0] not in exclude]
+
+
+def _fan_out(job):
+    author_id = job['author_id']
+
+    if job['kind'] == 'dm':
+        _deliver(job, [job['recipient_id']], 'dm')
+        return
+
+    usernames, everyone, here = parse_mentions(job['content'])
+
+    named = []
+    if usernames:
+        named = [row[0] for row in db.session.query(User.id).join(
+            ServerMember, ServerMember.user_id == User.id).filter(
+            ServerMember.server_id == job['server_id'], User.username.in_(usernames),
+            User.id != author_id).all()]
+        _deliver(job, named, 'mention')
+
+    if everyone or here:
+        reason = 'everyone' if everyone else 'here'
+        for batch in _member_batches(job['server_id'], author_id, set(named), online_only=not everyone):
+            _deliver(job, batch, reason)
+            # Let sockets run between batches of a large server
+            _socketio.sleep(0)
+
+
+def _deliver(job, user_ids, reason):
+    if not user_ids:
+        return
+
+    next_id = get_generator().next_id
+    now = datetime.utcnow()
+    preview = job['content'][:PREVIEW_LENGTH]
+    rows = [{
+        'id': next_id(), 'user_id': user_id, 'reason': reason,
+        'message_kind': job['kind'], 'message_id': job['message_id'],
+        'channel_id': job.get('channel_id'), 'server_id': job.get('server_id'),
+        'actor_id': job['author_id'], 'preview': preview, 'created_at': now,
+    } for user_id in user_ids]
+    db.session.execute(Notification.__table__.insert(), rows)
+    db.session.commit()
+
+    # Offline users pick these up through their cursor instead
+    online = [row for row in rows if row['user_id'] in _online]
+    if online:
+        actor = db.session.query(User.username).filter_by(id=job['author_id']).scalar()
+        for row in online:
+            emit_event('notification', serialize_notification(row, actor), to=user_room(row['user_id']))
+
+
+# ====================
+# CATCH-UP
+# ====================
+
+def serialize_notification(row, actor):
+    # Snowflake ids are sent as strings, like message history
+    return {
+        'id': str(row['id']),
+        'reason': row['reason'],
+        'message_kind': row['message_kind'],
+        'message_id': str(row['message_id']),
+        'channel_id': row['channel_id'],
+        'server_id': row['server_id'],
+        'actor_id': row['actor_id'],
+        'actor': actor,
+        'preview': row['preview'],
+        'created_at': row['created_at'].isoformat() if row['created_at'] else None,
+    }
+
+
+def _cursor_position(user_id):
+    return db.session.query(NotificationCursor.last_read_id).filter_by(user_id=user_id).scalar() or 0
+
+
+def unread_notifications(user_id, after=None, limit=NOTIFICATION_PAGE_SIZE):
+    """Notifications after `after` (default: the user's read cursor), oldest first."""
+    position = _cursor_position(user_id)
+    if after is None or after < position:
+        after = position
+
+    columns = [column for column in Notification.__table__.columns]
+    rows = db.session.query(*columns, User.username).outerjoin(
+        User, User.id == Notification.actor_id).filter(
+        Notification.user_id == user_id, Notification.id > after
+    ).order_by(Notification.id).limit(limit).all()
+
+    unread = db.session.query(db.func.count(Notification.id)).filter(
+        Notification.user_id == user_id, Notification.id > position).scalar()
+
+    return [serialize_notification(row._mapping, row.username) for row in rows], unread
+
+
+def acknowledge_notifications(user_id, up_to):
+    """Move the user's read cursor forward to `up_to`; it never moves back."""
+    cursor = db.session.get(NotificationCursor, user_id)
+    if cursor is None:
+        cursor = NotificationCursor(user_id=user_id, last_read_id=0)
+        db.session.add(cursor)
+    if up_to > (cursor.last_read_id or 0):
+        cursor.last_read_id = up_to
+        cursor.updated_at = datetime.utcnow()
+    db.session.commit()
+    return cursor.last_read_id
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+from models import db, Server, Channel
+from snowflake import next_id
+
+# Servers whose metadata is kept in memory, least recently used evicted first
+SERVER_CACHE_SIZE = 1024
+
+_cache = OrderedDict()
+_channel_servers = {}
+_generations = {}
+_lock = threading.Lock()
+
+
+def _serialize_channel(channel):
+    return {
+        'id': channel.id,
+        'name': channel.name,
+        'topic': channel.topic,
+        'type': channel.type,
+        'position': channel.position,
+        # Voice configuration; ignored for text channels
+        'bitrate': channel.bitrate,
+        'user_limit': channel.user_limit,
+    }
+
+
+def _load(server_id):
+    server = db.session.query(
+        Server.id, Server.name, Server.icon, Server.owner_id
+    ).filter(Server.id == server_id).first()
+    if server is None:
+        return None
+
+    channels = db.session.query(
+        Channel.id, Channel.name, Channel.topic, Channel.type, Channel.position, Channel.bitrate, Channel.user_limit
+    ).filter(Channel.server_id == server_id).order_by(Channel.position, Channel.id).all()
+
+    return {
+        'id': server.id,
+        'name': server.name,
+        'icon': server.icon,
+        'owner_id': server.owner_id,
+        # Snowflake versions never repeat, even across restarts, so a client
+        # holding an old version can't mistake a rebuilt entry for its own
+        'version': next_id(),
+        'channels': [_serialize_channel(channel) for channel in channels],
+    }
+
+
+def get_server_meta(server_id):
+    """Cached server row and ordered channel list, or None if the server doesn't exist.
+
+    The result is shared between requests and must not be modified.
+    """
+    with _lock:
+        meta = _cache.get(server_id)
+        if meta is not None:
+            _cache.move_to_end(server_id)
+            return meta
+        generation = _generations.get(server_id, 0)
+
+    meta = _load(server_id)
+    if meta is None:
+        return None
+    meta['channels_by_id'] = {channel['id']: channel for channel in meta['channels']}
+
+    with _lock:
+        # Don't store a result that an invalidation overtook while loading
+        if _generations.get(server_id, 0) == generation:
+            _cache[server_id] = meta
+            for channel in meta['channels']:
+                _channel_servers[channel['id']] = server_id
+            if len(_cache) > SERVER_CACHE_SIZE:
+                _, evicted = _cache.popitem(last=False)
+                _forget_channels(evicted)
+    return meta
+
+
+def _forget_channels(meta):
+    # Called with _lock held
+    for channel in meta['channels']:
+        _channel_servers.pop(channel['id'], None)
+
+
+def get_channel_meta(channel_id):
+    """(server meta, channel) for a channel, or (None, None) if it doesn't exist."""
+    server_id = _channel_servers.get(channel_id)
+    if server_id is None:
+        server_id = db.session.query(Channel.server_id).filter(Channel.id == channel_id).scalar()
+        if server_id is None:
+            return None, None
+
+    meta = get_server_meta(server_id)
+    channel = meta['channels_by_id'].get(channel_id) if meta else None
+    if channel is None:
+        return None, None
+    return meta, channel
+
+
+def invalidate_server(server_id):
+    """Drop a server's cached metadata after its row or channels change."""
+    with _lock:
+        _generations[server_id] = _generations.get(server_id, 0) + 1
+        meta = _cache.pop(server_id, None)
+        if meta is not None:
+            _forget_channels(meta)
+
+
+def public_meta(meta):
+    return {key: value for key, value in meta.items() if key != 'channels_by_id'}
@@ -0,0 +1,352 @@
+import heapq
+import json
+import os
+import random
+import uuid
+from datetime import datetime
+from operator import itemgetter
+from models import db, User, Server, ServerMember, Channel, Message, ArchivedMessageSegment
+from archive import decode_segment, isoformat, parse_datetime
+from snowflake import snowflakes_at, TIMESTAMP_SHIFT
+
+EXPORT_FORMAT_VERSION = 1
+
+# Rows fetched per round-trip while exporting
+EXPORT_YIELD_PER = 2000
+
+# Rows inserted per executemany() call (and per checkpoint) while importing
+IMPORT_BATCH_SIZE = 10000
+
+
+# ====================
+# EXPORT
+# ====================
+
+def _stream(query, yield_per=EXPORT_YIELD_PER):
+    # yield_per enables server-side cursors where the driver supports them,
+    # so only one buffer of rows is held in memory at a time
+    return query.yield_per(yield_per)
+
+
+def _archived_segments(channel_id):
+    # One segment loaded at a time, oldest month first
+    segment_ids = [row[0] for row in db.session.query(ArchivedMessageSegment.id).filter_by(
+        kind='channel', scope=str(channel_id)).order_by(ArchivedMessageSegment.min_id).all()]
+    for segment_id in segment_ids:
+        yield db.session.get(ArchivedMessageSegment, segment_id)
+
+
+def _archived_author_ids(channels):
+    # Authors who have since left the server only appear in the segments
+    author_ids = set()
+    for channel in channels:
+        for segment in _archived_segments(channel.id):
+            author_ids.update(row['author_id'] for row in decode_segment(segment))
+            db.session.expire_all()
+    return author_ids
+
+
+def export_server(server_id):
+    """Yield one NDJSON line per record for a server's full history."""
+    server = db.session.get(Server, server_id)
+    if server is None:
+        raise ValueError(f'Server {server_id} does not exist')
+
+    dumps = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+
+    yield dumps({'type': 'header', 'version': EXPORT_FORMAT_VERSION, 'exported_at': datetime.utcnow().isoformat()})
+    yield dumps({
+        'type': 'server', 'id': server.id, 'name': server.name, 'icon': server.icon,
+        'owner_id': server.owner_id, 'created_at': isoformat(server.created_at),
+    })
+
+    channels = Channel.query.filter_by(server_id=server_id).order_by(Channel.position, Channel.id).all()
+
+    # Members plus anyone who authored a message, hot or archived, so
+    # imported history keeps its authors
+    channel_ids = db.session.query(Channel.id).filter(Channel.server_id == server_id)
+    member_ids = db.session.query(ServerMember.user_id).filter(ServerMember.server_id == server_id)
+    author_ids = db.session.query(Message.author_id).filter(Message.channel_id.in_(channel_ids))
+    user_ids = member_ids.union(author_ids, db.session.query(db.literal(server.owner_id)))
+    archived_author_ids = _archived_author_ids(channels)
+    user_filter = User.id.in_(user_ids)
+    if archived_author_ids:
+        user_filter = user_filter | User.id.in_(archived_author_ids)
+    users = db.session.query(
+        User.id, User.username, User.email, User.password, User.avatar, User.created_at
+    ).filter(user_filter).order_by(User.id)
+    for user in _stream(users):
+        yield dumps({
+            'type': 'user', 'id': user.id, 'username': user.username, 'email': user.email,
+            'password': user.password, 'avatar': user.avatar, 'created_at': isoformat(user.created_at),
+        })
+
+    members = db.session.query(
+        ServerMember.user_id, ServerMember.role, ServerMember.joined_at
+    ).filter(ServerMember.server_id == server_id).order_by(ServerMember.id)
+    for member in _stream(members):
+        yield dumps({
+            'type': 'member', 'user_id': member.user_id, 'role': member.role,
+            'joined_at': isoformat(member.joined_at),
+        })
+
+    for channel in channels:
+        yield dumps({
+            'type': 'channel', 'id': channel.id, 'name': channel.name, 'topic': channel.topic,
+            'channel_type': channel.type, 'position': channel.position,
+            'bitrate': channel.bitrate, 'user_limit': channel.user_limit,
+            'created_at': isoformat(channel.created_at),
+        })
+
+    # Messages of all channels merged oldest first. Imported ids are derived
+    # from created_at, so the importer then appends to the primary key
+    # instead of inserting each channel's history across its whole range.
+    # The channels share the buffer a single stream would use.
+    yield_per = max(100, EXPORT_YIELD_PER // max(len(channels), 1))
+    for record in heapq.merge(*(_channel_messages(channel.id, yield_per) for channel in channels),
+                              key=itemgetter('id')):
+        yield dumps(record)
+
+
+def _channel_messages(channel_id, yield_per):
+    # Archived months first, then the hot table, so ids ascend
+    for segment in _archived_segments(channel_id):
+        for row in decode_segment(segment):
+            yield {
+                'type': 'message', 'id': row['id'], 'channel_id': channel_id,
+                'author_id': row['author_id'], 'content': row['content'],
+                'created_at': row['created_at'], 'edited_at': row['edited_at'],
+            }
+
+    messages = db.session.query(
+        Message.id, Message.author_id, Message.content, Message.created_at, Message.edited_at
+    ).filter(Message.channel_id == channel_id).order_by(Message.id)
+    for message in _stream(messages, yield_per):
+        yield {
+            'type': 'message', 'id': message.id, 'channel_id': channel_id,
+            'author_id': message.author_id, 'content': message.content,
+            'created_at': isoformat(message.created_at), 'edited_at': isoformat(message.edited_at),
+        }
+
+
+# ====================
+# IMPORT
+# ====================
+
+class _Checkpoint:
+    """Id mappings and progress of an import, persisted after every commit."""
+
+    def __init__(self, path):
+        self.path = path
+        self.line = 0
+        self.server_id = None
+        self.server_record = None
+        self.users = {}
+        self.channels = {}
+
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.line = state['line']
+            self.server_id = state['server_id']
+            self.server_record = state['server_record']
+            self.users = {int(k): v for k, v in state['users'].items()}
+            self.channels = {int(k): v for k, v in state['channels'].items()}
+
+    def save(self, line):
+        self.line = line
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'line': line, 'server_id': self.server_id, 'server_record': self.server_record,
+                       'users': self.users, 'channels': self.channels}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _unique_username(username, taken):
+    candidate = username
+    suffix = 1
+    while candidate in taken or (
+            candidate != username and db.session.query(User.id).filter_by(username=candidate).first()):
+        candidate = f'{username}_{suffix}'
+        suffix += 1
+    return candidate
+
+
+def _import_users(records, checkpoint):
+    # Existing accounts are matched by email, everyone else is created
+    emails = [record['email'] for record in records]
+    existing = dict(db.session.query(User.email, User.id).filter(User.email.in_(emails)).all())
+
+    new_records = [record for record in records if record['email'] not in existing]
+    if new_records:
+        wanted = [record['username'] for record in new_records]
+        taken = {row[0] for row in db.session.query(User.username).filter(User.username.in_(wanted)).all()}
+        rows = []
+        for record in new_records:
+            username = _unique_username(record['username'], taken)
+            taken.add(username)
+            rows.append({
+                'username': username, 'email': record['email'], 'password': record['password'],
+                'avatar': record['avatar'], 'status': 'offline', 'fs_uniquifier': uuid.uuid4().hex,
+                'created_at': parse_datetime(record['created_at']), 'last_seen': datetime.utcnow(),
+            })
+        db.session.execute(User.__table__.insert(), rows)
+        existing.update(db.session.query(User.email, User.id).filter(
+            User.email.in_([record['email'] for record in new_records])).all())
+
+    for record in records:
+        checkpoint.users[record['id']] = existing[record['email']]
+
+
+def _import_members(records, checkpoint):
+    already = {row[0] for row in db.session.query(ServerMember.user_id).filter(
+        ServerMember.server_id == checkpoint.server_id,
+        ServerMember.user_id.in_([checkpoint.users[record['user_id']] for record in records])).all()}
+    rows = []
+    for record in records:
+        user_id = checkpoint.users[record['user_id']]
+        if user_id not in already:
+            already.add(user_id)
+            rows.append({'user_id': user_id, 'server_id': checkpoint.server_id,
+                         'role': record['role'], 'joined_at': parse_datetime(record['joined_at'])})
+    if rows:
+        db.session.execute(ServerMember.__table__.insert(), rows)
+
+
+def _import_channels(records, checkpoint):
+    for record in records:
+        channel = Channel(
+            name=record['name'], topic=record['topic'], server_id=checkpoint.server_id,
+            type=record['channel_type'], position=record['position'],
+            bitrate=record['bitrate'], user_limit=record['user_limit'],
+            created_at=parse_datetime(record['created_at']),
+        )
+        db.session.add(channel)
+        db.session.flush()
+        checkpoint.channels[record['id']] = channel.id
+
+
+def _executemany(table, columns):
+    """Insert rows given column by column ({name: [values]}) with a single
+    DBAPI executemany().
+
+    Messages are the bulk of an import, so they skip SQLAlchemy's per-row
+    parameter handling; bind processors are still applied for the dialect.
+    """
+    connection = db.session.connection()
+    dialect = connection.dialect
+    names = list(columns)
+    compiled = table.insert().compile(dialect=dialect, column_keys=names)
+
+    # Work column by column so the per-row cost stays in C (zip) rather
+    # than in Python generator frames
+    values = {}
+    for name, column in columns.items():
+        process = table.c[name].type._cached_bind_processor(dialect)
+        values[name] = column if process is None else [None if value is None else process(value) for value in column]
+
+    if compiled.positional:
+        params = list(zip(*(values[name] for name in compiled.positiontup)))
+    else:
+        params = [dict(zip(names, row)) for row in zip(*values.values())]
+
+    connection.exec_driver_sql(str(compiled), params)
+
+
+def _import_messages(records, checkpoint):
+    users = checkpoint.users
+    channels = checkpoint.channels
+    parse = parse_datetime
+    created_at = [parse(record['created_at']) for record in records]
+    _executemany(Message.__table__, {
+        # Ids carry each message's original timestamp, so they keep sorting
+        # by created_at as archival expects. The low bits count up from a
+        # random start: records arrive oldest first, so messages sharing a
+        # millisecond keep their order, and importing the same export twice
+        # doesn't reuse ids.
+        'id': snowflakes_at(created_at, random.getrandbits(TIMESTAMP_SHIFT)),
+        'content': [record['content'] for record in records],
+        'author_id': [users[record['author_id']] for record in records],
+        'channel_id': [channels[record['channel_id']] for record in records],
+        'created_at': created_at,
+        'edited_at': [parse(record['edited_at']) for record in records],
+    })
+
+
+def _import_server(checkpoint, owner_id):
+    record = checkpoint.server_record
+    server = Server(
+        name=record['name'], icon=record['icon'],
+        owner_id=owner_id or checkpoint.users.get(record['owner_id']),
+        created_at=parse_datetime(record['created_at']),
+    )
+    db.session.add(server)
+    db.session.flush()
+    checkpoint.server_id = server.id
+
+
+_IMPORTERS = {
+    'user': _import_users,
+    'member': _import_members,
+    'channel': _import_channels,
+    'message': _import_messages,
+}
+
+
+def import_server(lines, checkpoint_path=None, owner_id=None, batch_size=IMPORT_BATCH_SIZE):
+    """Import an NDJSON export, resuming from checkpoint_path if it exists.
+
+    The checkpoint is removed once the import completes. Returns the new
+    server id and the number of records imported in this run.
+    """
+    checkpoint = _Checkpoint(checkpoint_path)
+    pending_type = None
+    pending = []
+    imported = 0
+
+    def flush(last_line):
+        nonlocal pending, imported
+        # The server is created once the owner's user record has been imported
+        if checkpoint.server_id is None and pending_type not in (None, 'user'):
+            _import_server(checkpoint, owner_id)
+        if pending:
+            _IMPORTERS[pending_type](pending, checkpoint)
+            imported += len(pending)
+            pending = []
+        db.session.commit()
+        checkpoint.save(last_line)
+
+    # raw_decode skips the whitespace checks json.loads makes around every
+    # record; export lines have none
+    decode = json.JSONDecoder().raw_decode
+    line_number = checkpoint.line
+    for line_number, line in enumerate(lines, start=1):
+        if line_number <= checkpoint.line or not line.strip():
+            continue
+
+        record = decode(line)[0]
+        record_type = record['type']
+        if record_type == 'header':
+            if record['version'] != EXPORT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported export version {record['version']}")
+            continue
+        if record_type == 'server':
+            checkpoint.server_record = record
+            continue
+        if record_type not in _IMPORTERS:
+            raise ValueError(f'Unknown record type {record_type!r} on line {line_number}')
+
+        if pending and (record_type != pending_type or len(pending) >= batch_size):
+            flush(line_number - 1)
+        pending_type = record_type
+        pending.append(record)
+
+    flush(line_number)
+    checkpoint.clear()
+    return checkpoint.server_id, imported
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Id layout, high bits to low: 41-bit millisecond timestamp, 10-bit worker
+# id, 12-bit per-millisecond sequence. Ids sort by creation time and fit in
+# a signed 64-bit column until 2084.
+TIMESTAMP_BITS = 41
+WORKER_ID_BITS = 10
+SEQUENCE_BITS = 12
+
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+WORKER_ID_SHIFT = SEQUENCE_BITS
+TIMESTAMP_SHIFT = SEQUENCE_BITS + WORKER_ID_BITS
+LOW_BITS_MASK = (1 << TIMESTAMP_SHIFT) - 1
+
+# Largest id a signed 64-bit column holds
+MAX_ID = (1 << 63) - 1
+
+# 2015-01-01T00:00:00Z, in milliseconds
+EPOCH_MS = 1420070400000
+
+# Autoincrement ids from before the switch are all below this; every
+# snowflake id is above it
+LEGACY_ID_LIMIT = 1 << 32
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+_UNIX_EPOCH = datetime(1970, 1, 1)
+_ONE_MS = timedelta(milliseconds=1)
+
+
+def _datetime_ms(value):
+    # created_at columns hold naive UTC datetimes. Exact timedelta
+    # arithmetic rather than a float timestamp, which is slower and can
+    # round down a millisecond.
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _UNIX_EPOCH) // _ONE_MS
+
+
+class SnowflakeGenerator:
+    """Time-sortable 64-bit id generator.
+
+    Ids are strictly increasing within a generator and unique across
+    generators with different worker ids, so every process writing messages
+    needs its own worker id (VOXIFY_WORKER_ID).
+    """
+
+    def __init__(self, worker_id=0, clock=_now_ms):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f'Worker id must be between 0 and {MAX_WORKER_ID}, got {worker_id}')
+        self.worker_id = worker_id
+        self._worker_bits = worker_id << WORKER_ID_SHIFT
+        self._clock = clock
+        self._last_timestamp = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            timestamp = self._clock() - EPOCH_MS
+
+            if timestamp < self._last_timestamp:
+                # The clock moved backwards; keep counting on the last
+                # timestamp so ids stay monotonic
+                timestamp = self._last_timestamp
+
+            if timestamp == self._last_timestamp:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond
+                    while timestamp <= self._last_timestamp:
+                        timestamp = self._clock() - EPOCH_MS
+            else:
+                self._sequence = 0
+
+            self._last_timestamp = timestamp
+            return (timestamp << TIMESTAMP_SHIFT) | self._worker_bits | self._sequence
+
+
+def worker_id_from_env():
+    return int(os.environ.get('VOXIFY_WORKER_ID', 0))
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = SnowflakeGenerator(worker_id_from_env())
+    return _generator
+
+
+def next_id():
+    """Next id from this process's generator (used as the column default)."""
+    return get_generator().next_id()
+
+
+def snowflake_at(created_at, low_bits):
+    """An id carrying created_at's timestamp, for rows that already have one.
+
+    The low 22 bits, worker id and sequence in generated ids, are taken
+    from low_bits; keeping them distinct between rows is up to the caller.
+    """
+    timestamp = _datetime_ms(created_at) - EPOCH_MS if created_at else 0
+    # Rows without a usable timestamp still land above LEGACY_ID_LIMIT
+    timestamp = max(timestamp, LEGACY_ID_LIMIT >> TIMESTAMP_SHIFT)
+    return (timestamp << TIMESTAMP_SHIFT) | (low_bits & LOW_BITS_MASK)
+
+
+def snowflakes_at(created_ats, first_low_bits):
+    """snowflake_at() for a batch of rows, the low bits counting up from
+    first_low_bits row by row."""
+    return [snowflake_at(created_at, low_bits)
+            for low_bits, created_at in enumerate(created_ats, first_low_bits)]
+
+
+def legacy_id_to_snowflake(legacy_id, created_at):
+    """Map an autoincrement id onto the snowflake layout.
+
+    The timestamp comes from created_at and the low 22 bits from the old
+    id, so existing rows keep their time order and stay unique as long as
+    no two rows 4M ids apart share a millisecond. Ids generated afterwards
+    sort after every migrated row.
+    """
+    return snowflake_at(created_at, legacy_id)
@@ -177,8 +177,77 @@ let currentCall = null;
 let isMuted = false;
 let isSpeakerEnabled = true;
 
-// SocketIO connection
-const socket = io();
+// SocketIO connection. With the MessagePack library loaded the client asks
+// for the compact binary wire format; servers that don't support it keep
+// talking JSON and never send the 'wire_format' handshake.
+const socket = io({ auth: window.MessagePack ? { wire: 'msgpack' } : {} });
+
+// Alias table from the server's handshake; null while speaking JSON
+let wireAliases = null;
+let wireKeyNames = null;
+let wireMinSize = 0;
+
+function renameWireKeys(value, table) {
+    // RTCSessionDescription and RTCIceCandidate keep their fields behind
+    // getters; toJSON() is what JSON.stringify would have sent
+    if (value && typeof value.toJSON === 'function') {
+        value = value.toJSON();
+    }
+    if (Array.isArray(value)) {
+        return value.map(item => renameWireKeys(item, table));
+    }
+    if (value && typeof value === 'object') {
+        const renamed = {};
+        for (const [key, item] of Object.entries(value)) {
+            renamed[table[key] || key] = renameWireKeys(item, table);
+        }
+        return renamed;
+    }
+    return value;
+}
+
+// Event payloads arrive as JSON objects or, once negotiated, as MessagePack
+// with aliased keys
+function fromWire(data) {
+    if (wireKeyNames && (data instanceof ArrayBuffer || ArrayBuffer.isView(data))) {
+        return renameWireKeys(MessagePack.decode(data), wireKeyNames);
+    }
+    return data;
+}
+
+function onEvent(event, handler) {
+    socket.on(event, data => handler(fromWire(data)));
+}
+
+function sendEvent(event, payload) {
+    if (wireAliases) {
+        const packed = MessagePack.encode(renameWireKeys(payload, wireAliases));
+        // Small payloads are cheaper as JSON than as a binary attachment
+        if (packed.byteLength >= wireMinSize) {
+            socket.emit(event, packed);
+            return;
+        }
+    }
+    socket.emit(event, payload);
+}
+
+socket.on('wire_format', function(handshake) {
+    if (handshake.format !== 'msgpack' || !window.MessagePack) {
+        return;
+    }
+    wireAliases = handshake.aliases;
+    wireKeyNames = {};
+    for (const [key, alias] of Object.entries(wireAliases)) {
+        wireKeyNames[alias] = key;
+    }
+    wireMinSize = handshake.min_size || 0;
+});
+
+socket.on('disconnect', function() {
+    // Renegotiated on reconnect, possibly with a server that only speaks JSON
+    wireAliases = null;
+    wireKeyNames = null;
+});
 
 // Configuration for STUN servers
 const configuration = {
@@ -216,15 +285,15 @@ function initVoiceChat() {
     }
     
     // SocketIO event listeners
-    socket.on('incoming_call', handleIncomingCall);
-    socket.on('call_accepted', handleCallAccepted);
-    socket.on('call_rejected', handleCallRejected);
-    socket.on('call_ended', handleCallEnded);
-    socket.on('offer', handleOffer);
-    socket.on('answer', handleAnswer);
-    socket.on('ice_candidate', handleIceCandidate);
-    socket.on('user_joined', handleUserJoined);
-    socket.on('user_left', handleUserLeft);
+    onEvent('incoming_call', handleIncomingCall);
+    onEvent('call_accepted', handleCallAccepted);
+    onEvent('call_rejected', handleCallRejected);
+    onEvent('call_ended', handleCallEnded);
+    onEvent('offer', handleOffer);
+    onEvent('answer', handleAnswer);
+    onEvent('ice_candidate', handleIceCandidate);
+    onEvent('user_joined', handleUserJoined);
+    onEvent('user_left', handleUserLeft);
 }
 
 // Start a voice call with a user
@@ -244,7 +313,7 @@ function startVoiceCall(targetUserId, targetUsername) {
             setupLocalAudio();
             
             // Send call request
-            socket.emit('voice_call', {
+            sendEvent('voice_call', {
                 target_user: targetUserId,
                 username: getCurrentUsername()
             });
@@ -283,7 +352,7 @@ function acceptCall() {
             createPeerConnection();
             
             // Send acceptance
-            socket.emit('call_accepted', {
+            sendEvent('call_accepted', {
                 target_user: currentCall.callerId
             });
             
@@ -293,7 +362,7 @@ function acceptCall() {
                     return peerConnection.setLocalDescription(offer);
                 })
                 .then(() => {
-                    socket.emit('offer', {
+                    sendEvent('offer', {
                         offer: peerConnection.localDescription,
                         target_user: currentCall.callerId
                     });
@@ -313,7 +382,7 @@ function rejectCall() {
     incomingCallContainer.classList.add('hidden');
     
     if (currentCall && currentCall.callerId) {
-        socket.emit('call_rejected', {
+        sendEvent('call_rejected', {
             target_user: currentCall.callerId
         });
     }
@@ -376,7 +445,7 @@ function createPeerConnection() {
     // Handle ICE candidates
     peerConnection.onicecandidate = event => {
         if (event.candidate) {
-            socket.emit('ice_candidate', {
+            sendEvent('ice_candidate', {
                 candidate: event.candidate,
                 target_user: currentCall.callerId || currentCall.targetUserId
             });
@@ -398,7 +467,7 @@ function handleOffer(data) {
             return peerConnection.setLocalDescription(answer);
         })
         .then(() => {
-            socket.emit('answer', {
+            sendEvent('answer', {
                 answer: peerConnection.localDescription,
                 target_user: data.user_id
             });
@@ -490,7 +559,7 @@ function toggleSpeaker() {
 // End call
 function endCall() {
     if (currentCall) {
-        socket.emit('end_call', {
+        sendEvent('end_call', {
             target_user: currentCall.callerId || currentCall.targetUserId
         });
     }
@@ -585,18 +654,18 @@ if (document.readyState === 'loading') {
 
 // Initialize voice channel functionality
 function initVoiceChannels() {
-    // Add event listeners to voice channel buttons
-    const voiceChannelButtons = document.querySelectorAll('.voice-channel-btn');
-    
-    voiceChannelButtons.forEach(button => {
-        button.addEventListener('click', function() {
-            const channelId = this.getAttribute('data-channel-id');
-            const action = this.getAttribute('data-action');
-            
-            if (action === 'join') {
-                joinVoiceChannel(channelId);
-            }
-        });
+    // Delegated, so buttons re-rendered with the channel list keep working
+    document.addEventListener('click', function(event) {
+        const button = event.target.closest('.voice-channel-btn');
+        if (!button) {
+            return;
+        }
+        const channelId = button.getAttribute('data-channel-id');
+        const action = button.getAttribute('data-action');
+        
+        if (action === 'join') {
+            joinVoiceChannel(channelId);
+        }
     });
 }
 
@@ -606,7 +675,7 @@ function joinVoiceChannel(channelId) {
     updateVoiceChannelButton(channelId, 'leave');
     
     // Join the SocketIO room for this channel
-    socket.emit('join_voice_channel', {
+    sendEvent('join_voice_channel', {
         channel_id: channelId,
         username: getCurrentUsername()
     });
@@ -622,7 +691,7 @@ function leaveVoiceChannel(channelId) {
     updateVoiceChannelButton(channelId, 'join');
     
     // Leave the SocketIO room for this channel
-    socket.emit('leave_voice_channel', {
+    sendEvent('leave_voice_channel', {
         channel_id: channelId
     });
     
@@ -646,26 +715,389 @@ function updateVoiceChannelButton(channelId, action) {
 }
 
 // Handle user joined voice channel
-socket.on('user_joined_voice_channel', function(data) {
+onEvent('user_joined_voice_channel', function(data) {
     addParticipant(data.user_id, data.username);
 });
 
 // Handle user left voice channel
-socket.on('user_left_voice_channel', function(data) {
+onEvent('user_left_voice_channel', function(data) {
     removeParticipant(data.user_id);
 });
 
 // Handle channel offer
-socket.on('channel_offer', function(data) {
+onEvent('channel_offer', function(data) {
     handleOffer(data);
 });
 
 // Handle channel answer
-socket.on('channel_answer', function(data) {
+onEvent('channel_answer', function(data) {
     handleAnswer(data);
 });
 
 // Handle channel ICE candidate
-socket.on('channel_ice_candidate', function(data) {
+onEvent('channel_ice_candidate', function(data) {
     handleIceCandidate(data);
 });
+
+// ====================
+// MESSAGE HISTORY
+// ====================
+
+// Load older messages when the user scrolls to the top of the message list.
+// The server reads through to archived history transparently.
+function initMessageHistory() {
+    const messageList = document.getElementById('messageList');
+    if (!messageList || !messageList.dataset.historyUrl) {
+        return;
+    }
+    
+    let loading = false;
+    let exhausted = false;
+    
+    messageList.addEventListener('scroll', function() {
+        if (loading || exhausted || messageList.scrollTop > 50) {
+            return;
+        }
+        
+        const oldest = messageList.querySelector('.message[data-message-id]');
+        if (!oldest) {
+            return;
+        }
+        
+        loading = true;
+        fetch(`${messageList.dataset.historyUrl}?before=${oldest.dataset.messageId}`)
+            .then(response => response.json())
+            .then(data => {
+                const previousHeight = messageList.scrollHeight;
+                data.messages.slice().reverse().forEach(message => {
+                    messageList.insertBefore(renderHistoryMessage(message), messageList.firstChild);
+                });
+                // Keep the view anchored on the message the user was reading
+                messageList.scrollTop += messageList.scrollHeight - previousHeight;
+                exhausted = !data.next_before;
+            })
+            .catch(error => {
+                console.error('Error loading message history:', error);
+            })
+            .finally(() => {
+                loading = false;
+            });
+    });
+}
+
+function renderHistoryMessage(message) {
+    const element = document.createElement('div');
+    element.className = 'message mb-4';
+    element.dataset.messageId = message.id;
+    element.innerHTML = `
+        <div class="flex">
+            <div class="mr-4 flex-shrink-0">
+                <div class="w-10 h-10 rounded-full bg-gray-600 flex items-center justify-center">
+                    <i class="fas fa-user text-lightest"></i>
+                </div>
+            </div>
+            <div class="flex-1">
+                <div class="flex items-baseline">
+                    <strong class="text-lightest mr-2"></strong>
+                    <small class="text-gray-400 text-xs"></small>
+                </div>
+                <div class="mt-1 text-lightest"></div>
+            </div>
+        </div>`;
+    element.querySelector('strong').textContent = message.author || message.sender;
+    element.querySelector('small').textContent = message.created_at.slice(0, 16).replace('T', ' ');
+    element.querySelector('.mt-1').textContent = message.content;
+    (message.attachments || []).forEach(attachment => {
+        element.querySelector('.flex-1').appendChild(renderAttachment(attachment));
+    });
+    return element;
+}
+
+function renderAttachment(attachment) {
+    const wrapper = document.createElement('div');
+    wrapper.className = 'mt-2';
+    const link = document.createElement('a');
+    link.href = attachment.url;
+    if (attachment.thumbnail_url) {
+        link.target = '_blank';
+        const image = document.createElement('img');
+        image.src = attachment.thumbnail_url;
+        image.alt = attachment.filename;
+        image.loading = 'lazy';
+        image.className = 'rounded-lg max-w-xs';
+        link.appendChild(image);
+    } else {
+        link.className = 'text-primary hover:underline';
+        link.textContent = attachment.filename;
+    }
+    wrapper.appendChild(link);
+    return wrapper;
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initMessageHistory);
+} else {
+    initMessageHistory();
+}
+
+// ====================
+// MEMBER LIST
+// ====================
+
+const MEMBER_ROW_HEIGHT = 36;
+const MEMBER_WINDOW_SIZE = 100;
+const MEMBER_GROUP_LABELS = {
+    'owner': 'Owner',
+    'admin': 'Admins',
+    'member': 'Online',
+    'offline': 'Offline'
+};
+
+// Render the member sidebar as a virtual list. The server keeps a sorted
+// index of members and only sends (and keeps updating) the window the
+// client has subscribed to.
+function initMemberList() {
+    const memberList = document.getElementById('memberList');
+    if (!memberList) {
+        return;
+    }
+    
+    const serverId = memberList.dataset.serverId;
+    const spacer = memberList.querySelector('.member-list-spacer');
+    let subscribedStart = -1;
+    
+    function subscribe(start) {
+        subscribedStart = start;
+        sendEvent('subscribe_member_list', {
+            server_id: serverId,
+            start: start,
+            count: MEMBER_WINDOW_SIZE
+        });
+    }
+    
+    function render(data) {
+        // Group headers take a row each, so a member's row is its position
+        // plus the number of non-empty groups that start at or before it
+        const groups = data.groups.filter(group => group.count > 0);
+        spacer.style.height = `${(data.total + groups.length) * MEMBER_ROW_HEIGHT}px`;
+        memberList.querySelectorAll('.member-row').forEach(row => row.remove());
+        
+        groups.forEach((group, groupIndex) => {
+            if (group.offset >= data.start && group.offset < data.start + data.members.length) {
+                const header = document.createElement('div');
+                header.className = 'member-row absolute left-0 right-0 px-2 pt-3 text-xs uppercase text-gray-400 tracking-wider';
+                header.style.top = `${(group.offset + groupIndex) * MEMBER_ROW_HEIGHT}px`;
+                header.textContent = `${MEMBER_GROUP_LABELS[group.id]} (${group.count})`;
+                memberList.appendChild(header);
+            }
+        });
+        
+        data.members.forEach((member, i) => {
+            const position = data.start + i;
+            const headersBefore = groups.filter(group => group.offset <= position).length;
+            const row = document.createElement('div');
+            row.className = 'member-row absolute left-0 right-0 flex items-center px-2 text-lightest';
+            row.style.top = `${(position + headersBefore) * MEMBER_ROW_HEIGHT}px`;
+            row.style.height = `${MEMBER_ROW_HEIGHT}px`;
+            row.innerHTML = '<i class="fas fa-circle text-xs mr-2"></i><span class="text-sm truncate"></span>';
+            row.querySelector('.fa-circle').classList.add(getStatusClass(member.status));
+            row.querySelector('.truncate').textContent = member.username;
+            if (member.status === 'offline') {
+                row.classList.add('opacity-50');
+            }
+            memberList.appendChild(row);
+        });
+    }
+    
+    onEvent('member_list_sync', function(data) {
+        if (String(data.server_id) === serverId) {
+            render(data);
+        }
+    });
+    
+    memberList.addEventListener('scroll', function() {
+        // Keep a quarter window of slack above the visible rows
+        const firstVisible = Math.floor(memberList.scrollTop / MEMBER_ROW_HEIGHT);
+        const start = Math.max(0, firstVisible - MEMBER_WINDOW_SIZE / 4);
+        if (Math.abs(start - subscribedStart) >= MEMBER_WINDOW_SIZE / 4) {
+            subscribe(start);
+        }
+    });
+    
+    // Subscribe again after a reconnect, since subscriptions live on the socket
+    socket.on('connect', function() {
+        subscribe(Math.max(0, subscribedStart));
+    });
+    if (socket.connected) {
+        subscribe(0);
+    }
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initMemberList);
+} else {
+    initMemberList();
+}
+
+// ====================
+// SERVER CHANNELS
+// ====================
+
+const CHANNEL_LINK_CLASS = 'flex items-center px-2 py-1.5 rounded text-lightest hover:bg-gray-700 transition-colors duration-200';
+const VOICE_BUTTON_CLASS = 'voice-channel-btn w-6 h-6 rounded-full bg-gray-700 hover:bg-gray-600 flex items-center justify-center text-light transition-colors duration-200 text-xs';
+
+// The channel sidebar comes with the page. When the tab is shown again or
+// the socket reconnects, check it against the server's metadata version;
+// an unchanged channel list costs a 304 with no body.
+function initServerChannels() {
+    const header = document.getElementById('serverHeader');
+    const textList = document.getElementById('textChannelList');
+    const voiceList = document.getElementById('voiceChannelList');
+    if (!header || !header.dataset.metaUrl || !textList || !voiceList) {
+        return;
+    }
+    
+    let checking = false;
+    let disconnected = false;
+    
+    function textChannel(channel) {
+        const link = document.createElement('a');
+        link.href = `/channel/${channel.id}`;
+        link.className = CHANNEL_LINK_CLASS;
+        if (String(channel.id) === textList.dataset.activeChannelId) {
+            link.classList.add('bg-gray-700');
+        }
+        link.innerHTML = '<i class="fas fa-hashtag text-gray-400 mr-1.5 text-sm"></i><span class="text-sm truncate"></span>';
+        link.querySelector('.truncate').textContent = channel.name;
+        return link;
+    }
+    
+    function voiceChannel(channel) {
+        const row = document.createElement('div');
+        row.className = CHANNEL_LINK_CLASS;
+        row.innerHTML = '<div class="flex items-center"><i class="fas fa-volume-up text-gray-400 mr-1.5 text-sm"></i><span class="text-sm truncate"></span></div>';
+        row.querySelector('.truncate').textContent = channel.name;
+        if (voiceList.dataset.joinButtons) {
+            row.classList.add('justify-between');
+            // Keep the leave button of a channel the user is in
+            const current = voiceList.querySelector(`.voice-channel-btn[data-channel-id="${channel.id}"]`);
+            const button = document.createElement('button');
+            button.className = VOICE_BUTTON_CLASS;
+            button.dataset.channelId = channel.id;
+            button.dataset.action = current ? current.dataset.action : 'join';
+            button.innerHTML = button.dataset.action === 'leave' ? '<i class="fas fa-phone-slash"></i>' : '<i class="fas fa-phone"></i>';
+            row.appendChild(button);
+        }
+        return row;
+    }
+    
+    function render(server) {
+        textList.replaceChildren(...server.channels.filter(channel => channel.type === 'text').map(textChannel));
+        voiceList.replaceChildren(...server.channels.filter(channel => channel.type === 'voice').map(voiceChannel));
+    }
+    
+    function revalidate() {
+        if (checking || document.visibilityState !== 'visible') {
+            return;
+        }
+        checking = true;
+        // no-store, so the browser's cache doesn't turn our 304 back into
+        // the last full response
+        fetch(`${header.dataset.metaUrl}?version=${encodeURIComponent(header.dataset.serverVersion)}`, {cache: 'no-store'})
+            .then(response => response.status === 200 ? response.json() : null)
+            .then(server => {
+                if (server) {
+                    header.dataset.serverVersion = server.version;
+                    render(server);
+                }
+            })
+            .catch(error => {
+                console.error('Error checking channels:', error);
+            })
+            .finally(() => {
+                checking = false;
+            });
+    }
+    
+    document.addEventListener('visibilitychange', revalidate);
+    socket.on('disconnect', function() {
+        disconnected = true;
+    });
+    socket.on('connect', function() {
+        if (disconnected) {
+            disconnected = false;
+            revalidate();
+        }
+    });
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initServerChannels);
+} else {
+    initServerChannels();
+}
+
+// ====================
+// NOTIFICATIONS
+// ====================
+
+function initNotifications() {
+    const bell = document.getElementById('notificationBell');
+    const badge = document.getElementById('notificationBadge');
+    if (!bell || !badge) {
+        return;
+    }
+    
+    // Ids are snowflake strings; keep them as strings end to end
+    let unread = 0;
+    let latestId = null;
+    
+    function showCount() {
+        badge.textContent = unread > 99 ? '99+' : String(unread);
+        badge.classList.toggle('hidden', unread === 0);
+    }
+    
+    function catchUp() {
+        // Offline users catch up from their read cursor
+        fetch(bell.dataset.url)
+            .then(response => response.json())
+            .then(data => {
+                unread = data.unread;
+                if (data.notifications.length) {
+                    latestId = data.notifications[data.notifications.length - 1].id;
+                }
+                showCount();
+            })
+            .catch(error => {
+                console.error('Error loading notifications:', error);
+            });
+    }
+    
+    onEvent('notification', function(notification) {
+        unread += 1;
+        latestId = notification.id;
+        bell.title = `${notification.actor}: ${notification.preview}`;
+        showCount();
+    });
+    
+    bell.addEventListener('click', function() {
+        if (!latestId) {
+            return;
+        }
+        fetch(bell.dataset.ackUrl, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({up_to: latestId})
+        }).then(catchUp);
+    });
+    
+    // Anything pushed while disconnected is picked up again on reconnect
+    socket.on('connect', catchUp);
+    catchUp();
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initNotifications);
+} else {
+    initNotifications();
+}
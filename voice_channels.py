@@ -1,10 +1,44 @@
 from flask import session
-from flask_socketio import join_room, leave_room, emit
 from models import db, VoiceParticipant
+import wire_format
+from wire_format import accepts_binary, emit_event
+
+# Signaling events forwarded from one user to another: incoming event ->
+# (event delivered to data['target_user'], fields copied from the sender's
+# data). The sender's user id is added from their session. asgi.py
+# registers its handlers from the same table.
+SIGNALING_RELAYS = {
+    'offer': ('offer', ('offer',)),
+    'answer': ('answer', ('answer',)),
+    'ice_candidate': ('ice_candidate', ('candidate',)),
+    'voice_call': ('incoming_call', ('username',)),
+    'call_accepted': ('call_accepted', ()),
+    'call_rejected': ('call_rejected', ()),
+    'end_call': ('call_ended', ()),
+    # Voice channels use the same signaling, scoped to a channel
+    'channel_offer': ('channel_offer', ('offer', 'channel_id')),
+    'channel_answer': ('channel_answer', ('answer', 'channel_id')),
+    'channel_ice_candidate': ('channel_ice_candidate', ('candidate', 'channel_id')),
+}
+
+
+def relay_payload(fields, user_id, data):
+    payload = {field: data[field] for field in fields}
+    payload['user_id'] = user_id
+    return payload
+
+
+def _register_relay(socketio, event, target_event, fields):
+    @socketio.on(event)
+    @accepts_binary
+    def handle_relay(data):
+        emit_event(target_event, relay_payload(fields, session['user_id'], data), to=data['target_user'])
+
 
 # Voice Channel Event Handlers
 def register_voice_channel_events(socketio):
     @socketio.on('join_voice_channel')
+    @accepts_binary
     def handle_join_voice_channel(data):
         channel_id = data['channel_id']
         user_id = session.get('user_id')
@@ -13,7 +47,7 @@ def register_voice_channel_events(socketio):
             return
         
         # Join the SocketIO room for this channel
-        join_room(f'channel_{channel_id}')
+        wire_format.join(f'channel_{channel_id}')
         
         # Add user to voice participants in database
         existing_participant = VoiceParticipant.query.filter_by(
@@ -25,12 +59,13 @@ def register_voice_channel_events(socketio):
             db.session.commit()
         
         # Notify others in the channel
-        emit('user_joined_voice_channel', {
+        emit_event('user_joined_voice_channel', {
             'user_id': user_id,
             'username': data.get('username', 'Unknown')
-        }, room=f'channel_{channel_id}')
+        }, to=f'channel_{channel_id}')
     
     @socketio.on('leave_voice_channel')
+    @accepts_binary
     def handle_leave_voice_channel(data):
         channel_id = data['channel_id']
         user_id = session.get('user_id')
@@ -39,7 +74,7 @@ def register_voice_channel_events(socketio):
             return
         
         # Leave the SocketIO room for this channel
-        leave_room(f'channel_{channel_id}')
+        wire_format.leave(f'channel_{channel_id}')
         
         # Remove user from voice participants in database
         participant = VoiceParticipant.query.filter_by(
@@ -50,45 +85,10 @@ def register_voice_channel_events(socketio):
             db.session.commit()
         
         # Notify others in the channel
-        emit('user_left_voice_channel', {
+        emit_event('user_left_voice_channel', {
             'user_id': user_id
-        }, room=f'channel_{channel_id}')
+        }, to=f'channel_{channel_id}')
     
-    # We can reuse some of the existing WebRTC signaling events for voice channels
-    # The main difference is that we'll use channel rooms instead of user-to-user rooms
-    
-    @socketio.on('channel_offer')
-    def handle_channel_offer(data):
-        offer = data['offer']
-        channel_id = data['channel_id']
-        target_user = data['target_user']
-        
-        emit('channel_offer', {
-            'offer': offer,
-            'user_id': session['user_id'],
-            'channel_id': channel_id
-        }, room=target_user)
-    
-    @socketio.on('channel_answer')
-    def handle_channel_answer(data):
-        answer = data['answer']
-        channel_id = data['channel_id']
-        target_user = data['target_user']
-        
-        emit('channel_answer', {
-            'answer': answer,
-            'user_id': session['user_id'],
-            'channel_id': channel_id
-        }, room=target_user)
-    
-    @socketio.on('channel_ice_candidate')
-    def handle_channel_ice_candidate(data):
-        candidate = data['candidate']
-        channel_id = data['channel_id']
-        target_user = data['target_user']
-        
-        emit('channel_ice_candidate', {
-            'candidate': candidate,
-            'user_id': session['user_id'],
-            'channel_id': channel_id
-        }, room=target_user)
+    # WebRTC signaling, both 1:1 calls and voice channels
+    for event, (target_event, fields) in SIGNALING_RELAYS.items():
+        _register_relay(socketio, event, target_event, fields)
@@ -0,0 +1,272 @@
+import asyncio
+from functools import wraps
+from flask import request
+
+try:
+    import msgpack
+except ImportError:
+    # Without msgpack every client is answered in JSON
+    msgpack = None
+
+WIRE_JSON = 'json'
+WIRE_MSGPACK = 'msgpack'
+
+# Clients that connect with auth={'wire': 'msgpack'} get event payloads as
+# one MessagePack binary attachment with long keys replaced by these short
+# aliases, and may send theirs the same way. Everyone else keeps getting
+# plain JSON. The aliases cover keys repeated in signaling, presence, member
+# list and notification payloads, and must not clash with any real key.
+KEY_ALIASES = {
+    'user_id': 'u',
+    'username': 'n',
+    'channel_id': 'c',
+    'server_id': 's',
+    'target_user': 't',
+    'room': 'r',
+    'offer': 'o',
+    'answer': 'a',
+    'candidate': 'k',
+    'type': 'y',
+    'sdp': 'd',
+    'sdpMid': 'm',
+    'sdpMLineIndex': 'l',
+    'usernameFragment': 'f',
+    'members': 'M',
+    'groups': 'G',
+    'status': 'S',
+    'group': 'g',
+    'start': 'b',
+    'count': 'N',
+    'offset': 'O',
+    'total': 'T',
+    'id': 'I',
+    'reason': 'R',
+    'message_kind': 'K',
+    'message_id': 'X',
+    'actor_id': 'A',
+    'actor': 'P',
+    'preview': 'V',
+    'created_at': 'C',
+}
+_KEY_NAMES = {alias: key for key, alias in KEY_ALIASES.items()}
+
+# A binary attachment adds a placeholder object and a second WebSocket
+# frame, about 35 bytes; encoded payloads smaller than this go out as JSON
+# even to binary clients, which accept both
+BINARY_MIN_SIZE = 64
+
+# Binary sockets join "<room>#msgpack" instead of the room itself, so a
+# broadcast is encoded once per format rather than once per socket
+MIRROR_SUFFIX = '#msgpack'
+
+_transport = None
+
+# sid -> negotiated format, for every connected socket
+_sid_formats = {}
+
+# Rooms joined through join(), so binary sockets can be counted per mirror
+_sid_rooms = {}
+_mirror_members = {}
+
+
+class _SocketIOTransport:
+    # Flask-SocketIO, as run by app.py
+    def __init__(self, socketio):
+        self.socketio = socketio
+
+    def emit(self, event, data, to):
+        self.socketio.emit(event, data, to=to)
+
+    def enter_room(self, sid, room):
+        self.socketio.server.enter_room(sid, room, namespace='/')
+
+    def leave_room(self, sid, room):
+        self.socketio.server.leave_room(sid, room, namespace='/')
+
+
+class _AsyncServerTransport:
+    """A python-socketio AsyncServer (asgi.py) driven from synchronous code.
+
+    Calls are scheduled on the server's event loop, whether they come from
+    that loop or from another thread such as the WSGI adapter running
+    Flask routes or the notification worker.
+    """
+
+    def __init__(self, sio, loop):
+        self.sio = sio
+        self.loop = loop
+
+    def _schedule(self, coroutine):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self.loop.create_task(coroutine)
+        else:
+            asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def emit(self, event, data, to):
+        self._schedule(self.sio.emit(event, data, to=to))
+
+    def enter_room(self, sid, room):
+        self._schedule(self.sio.enter_room(sid, room))
+
+    def leave_room(self, sid, room):
+        self._schedule(self.sio.leave_room(sid, room))
+
+
+def init_app(socketio):
+    global _transport
+    _transport = _SocketIOTransport(socketio)
+
+
+def init_async_server(sio, loop):
+    """Send events through an asyncio Socket.IO server instead (ASGI mode)."""
+    global _transport
+    _transport = _AsyncServerTransport(sio, loop)
+
+
+# ====================
+# ENCODING
+# ====================
+
+def _alias_keys(value, table):
+    if isinstance(value, dict):
+        return {table.get(key, key): _alias_keys(item, table) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_alias_keys(item, table) for item in value]
+    return value
+
+
+def encode(payload):
+    return msgpack.packb(_alias_keys(payload, KEY_ALIASES), use_bin_type=True)
+
+
+def _binary_payload(payload):
+    packed = encode(payload)
+    return packed if len(packed) >= BINARY_MIN_SIZE else payload
+
+
+def decode(data):
+    """Turn an incoming event argument back into a plain dict.
+
+    Binary arguments are MessagePack with aliased keys; anything else is
+    already a JSON payload and is returned as is.
+    """
+    if isinstance(data, (bytes, bytearray)) and msgpack is not None:
+        return _alias_keys(msgpack.unpackb(data, raw=False), _KEY_NAMES)
+    return data
+
+
+def accepts_binary(handler):
+    """Decode a handler's event argument from whichever format the client used."""
+    @wraps(handler)
+    def wrapper(data=None, *args):
+        return handler(decode(data), *args)
+    return wrapper
+
+
+# ====================
+# NEGOTIATION
+# ====================
+
+def choose_format(sid, auth):
+    """Record the format a newly connected socket asked for.
+
+    Returns the 'wire_format' handshake to send it, or None for JSON.
+    Binary clients keep sending JSON until they have the handshake, so
+    servers without this module (or without msgpack) simply never switch
+    them over.
+    """
+    wanted = auth.get('wire') if isinstance(auth, dict) else None
+    wire = WIRE_MSGPACK if wanted == WIRE_MSGPACK and msgpack is not None else WIRE_JSON
+    _sid_formats[sid] = wire
+    if wire != WIRE_MSGPACK:
+        return None
+    return {'format': wire, 'aliases': KEY_ALIASES, 'min_size': BINARY_MIN_SIZE}
+
+
+def negotiate(sid, auth):
+    handshake = choose_format(sid, auth)
+    if handshake is not None:
+        _transport.emit('wire_format', handshake, sid)
+
+
+def forget(sid):
+    _sid_formats.pop(sid, None)
+    for room in _sid_rooms.pop(sid, ()):
+        _mirror_left(room)
+
+
+def is_binary(sid):
+    return _sid_formats.get(sid) == WIRE_MSGPACK
+
+
+def mirror_room(room):
+    return f'{room}{MIRROR_SUFFIX}'
+
+
+def _mirror_left(room):
+    remaining = _mirror_members.get(room, 0) - 1
+    if remaining > 0:
+        _mirror_members[room] = remaining
+    else:
+        _mirror_members.pop(room, None)
+
+
+def room_to_enter(sid, room):
+    """The room a socket joining `room` actually enters: its mirror for binary sockets."""
+    if not is_binary(sid):
+        return room
+    rooms = _sid_rooms.setdefault(sid, set())
+    if room not in rooms:
+        rooms.add(room)
+        _mirror_members[room] = _mirror_members.get(room, 0) + 1
+    return mirror_room(room)
+
+
+def room_to_leave(sid, room):
+    if not is_binary(sid):
+        return room
+    rooms = _sid_rooms.get(sid, set())
+    if room in rooms:
+        rooms.discard(room)
+        _mirror_left(room)
+    return mirror_room(room)
+
+
+def join(room, sid=None):
+    """join_room() that puts binary sockets in the room's mirror instead."""
+    sid = sid or request.sid
+    _transport.enter_room(sid, room_to_enter(sid, room))
+
+
+def leave(room, sid=None):
+    sid = sid or request.sid
+    _transport.leave_room(sid, room_to_leave(sid, room))
+
+
+# ====================
+# EMITTING
+# ====================
+
+def deliveries(payload, to):
+    """(data, target) pairs that deliver payload to a sid or room in every negotiated format."""
+    if to in _sid_formats:
+        # A single socket
+        return [(_binary_payload(payload) if is_binary(to) else payload, to)]
+    targets = [(payload, to)]
+    if _mirror_members.get(to):
+        targets.append((_binary_payload(payload), mirror_room(to)))
+    return targets
+
+
+def emit_event(event, payload, to=None):
+    """Emit to a sid or room in each recipient's negotiated format.
+
+    Without a target the event goes back to the socket that sent the
+    current event, like flask_socketio.emit().
+    """
+    for data, target in deliveries(payload, request.sid if to is None else to):
+        _transport.emit(event, data, target)